@@ -1,7 +1,9 @@
 from .grid import *
 from .molecule import *
 from .molparser import *
+from .occupancy import *
 from .transforms import *
 from .view import *
 from .voxel import *
 from .voxel_dataset import *
+from .voxel_store import *
@@ -14,22 +14,46 @@ class Grid3D:
         axes:
             A tuple with the axes (x, y, z).
         points:
-            A tuple with the coordinates of the grid points (x, y, z).
+            A tuple with the coordinates of the grid points (x, y, z). Computed on
+            demand if the grid is separable.
         axes_dims:
             A tuple with the size of the grid in each dimension (x, y, z).
+        vox_size:
+            Voxel size.
     """
 
-    def __init__(self, vox_size: float, box_dims: List[float]):
+    def __init__(self, vox_size: float, box_dims: List[float], separable: bool = False):
         """Initialize a 3D grid of points.
 
         Args:
             vox_size: Voxel size.
             box_dims: Dimensions of the box containing the grid.
+            separable: If True, only the axes are stored and the grid points are
+                computed on demand. A regular grid is fully described by its axes,
+                which take 3 * N^(1/3) instead of 3 * N values.
         """
         self._vox_size = vox_size
         self._box_dims = torch.tensor(box_dims, dtype=DTYPE)
+        self.separable = separable
         self.axes = self._build_grid_axes()
-        self.points = self._build_grid()
+        self._points = None if separable else self._build_grid()
+
+    @property
+    def points(self):
+        """Get the coordinates of the grid points (x, y, z)."""
+        if self._points is None:
+            return self._build_grid()
+        return self._points
+
+    @property
+    def vox_size(self) -> float:
+        """Get the voxel size."""
+        return self._vox_size
+
+    @property
+    def box_dims(self) -> List[float]:
+        """Get the dimensions of the box containing the grid."""
+        return self._box_dims.tolist()
 
     @property
     def axes_dims(self):
@@ -67,4 +91,3 @@ class Grid3D:
         )
 
         return points
-        return points
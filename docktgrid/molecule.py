@@ -5,8 +5,13 @@ import numpy as np
 import torch
 
 from docktgrid.config import DTYPE
-from docktgrid.molparser import MolecularData, MolecularParser, Parser
-from docktgrid.periodictable import ptable
+from docktgrid.molparser import (
+    MolecularData,
+    MolecularParser,
+    Parser,
+    extract_binding_pocket,
+)
+from docktgrid.periodictable import atomic_symbols, get_vdw_radii
 
 __all__ = ["MolecularComplex"]
 
@@ -16,6 +21,9 @@ class MolecularComplex:
 
     If the files are already parsed, pass them as MolecularData objects.
 
+    The protein can be cropped to the binding pocket, i.e. the atoms near the ligand
+    center, so that later steps (channel masks, voxelization) only see those atoms.
+
     Attrs:
         protein_data:
             A `MolecularData` object.
@@ -29,10 +37,24 @@ class MolecularComplex:
             An integer with the number of protein atoms.
         n_atoms_ligand:
             An integer with the number of ligand atoms.
+        atomic_numbers:
+            A np.ndarray of shape (n_atoms,), type uint8.
         element_symbols:
             A np.ndarray of shape (n_atoms,), type str.
+        atom_names:
+            A np.ndarray of shape (n_atoms,), type bytes; empty for atoms read from
+            files without atom names.
+        residue_names:
+            A np.ndarray of shape (n_atoms,), type bytes; empty for atoms read from
+            files without residue names.
         vdw_radii:
             A torch.Tensor of shape (n_atoms,).
+        pocket_indices:
+            A torch.Tensor with the indices of the protein atoms kept in the pocket,
+            relative to the original protein, or None if it was not cropped.
+        channels_cache:
+            A dict with the channels masks of cacheable views, filled by
+            `VoxelGrid.get_channels_mask`.
 
     """
 
@@ -42,6 +64,8 @@ class MolecularComplex:
         ligand_file: Union[str, MolecularData],
         molparser: Optional[Parser] = MolecularParser(),
         path="",
+        pocket_radius: Optional[float] = None,
+        pocket_cutoff: float = 0.0,
     ):
         """Initialize MolecularComplex.
 
@@ -54,6 +78,13 @@ class MolecularComplex:
                 A `MolecularParser` object.
             path:
                 Path to the files.
+            pocket_radius:
+                If given, protein atoms farther than `pocket_radius` plus a margin of
+                `pocket_cutoff` times their vdW radius from the ligand center are
+                discarded. See `VoxelGrid.get_pocket_params` for values that keep
+                every atom that contributes to a voxel grid, in any rotation.
+            pocket_cutoff:
+                Margin of the pocket, as a multiple of each atom's vdW radius.
         """
         if isinstance(protein_file, MolecularData):
             self.protein_data = protein_file
@@ -70,18 +101,59 @@ class MolecularComplex:
             )
 
         self.ligand_center = torch.mean(self.ligand_data.coords, 1).to(dtype=DTYPE)
+        self.pocket_indices = None
+        if pocket_radius is not None:
+            self.pocket_indices = self._crop_pocket(pocket_radius, pocket_cutoff)
+
         self.coords = torch.cat((self.protein_data.coords, self.ligand_data.coords), 1)
         self.n_atoms: int = self.coords.shape[1]
         self.n_atoms_protein: int = self.protein_data.coords.shape[1]
         self.n_atoms_ligand: int = self.ligand_data.coords.shape[1]
 
-        self.element_symbols: np.ndarray[str] = np.concatenate(
-            (self.protein_data.element_symbols, self.ligand_data.element_symbols)
+        self.atomic_numbers: np.ndarray = np.concatenate(
+            (self.protein_data.atomic_numbers, self.ligand_data.atomic_numbers)
         )
+        self.atom_names: np.ndarray = self._concat_names("atom_names")
+        self.residue_names: np.ndarray = self._concat_names("residue_names")
         self.vdw_radii = self._get_vdw_radii()
+        self.channels_cache = {}
 
-    def _get_vdw_radii(self):
-        return torch.tensor(
-            [ptable[a.title()]["vdw"] for a in self.element_symbols],
-            dtype=DTYPE,
+    @property
+    def element_symbols(self) -> np.ndarray:
+        """Get element symbols, np.ndarray of shape (n_atoms,), type str."""
+        return atomic_symbols[self.atomic_numbers]
+
+    def _crop_pocket(self, pocket_radius: float, pocket_cutoff: float):
+        protein = self.protein_data
+        vdw_radii = torch.nan_to_num(get_vdw_radii(protein.atomic_numbers))
+        radius = pocket_radius + pocket_cutoff * vdw_radii.to(dtype=DTYPE)
+        indices = extract_binding_pocket(protein.coords, self.ligand_center, radius)
+        self.protein_data = MolecularData(
+            protein.molecule_object,
+            protein.coords[:, indices],
+            atomic_numbers=protein.atomic_numbers[indices.numpy()],
+            atom_names=_take(protein.atom_names, indices.numpy()),
+            residue_names=_take(protein.residue_names, indices.numpy()),
         )
+        return indices
+
+    def _concat_names(self, attr: str) -> np.ndarray:
+        names = []
+        for data in (self.protein_data, self.ligand_data):
+            values = getattr(data, attr, None)
+            if values is None:
+                values = np.zeros(data.coords.shape[1], dtype="S1")
+            names.append(values)
+        return np.concatenate(names)
+
+    def _get_vdw_radii(self):
+        vdw_radii = get_vdw_radii(self.atomic_numbers).to(dtype=DTYPE)
+        unknown = torch.isnan(vdw_radii)
+        if torch.any(unknown):
+            symbols = np.unique(self.element_symbols[unknown.numpy()])
+            raise ValueError(f"Unknown vdW radii for elements: {', '.join(symbols)}.")
+        return vdw_radii
+
+
+def _take(values: Optional[np.ndarray], indices: np.ndarray) -> Optional[np.ndarray]:
+    return None if values is None else values[indices]
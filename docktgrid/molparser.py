@@ -1,31 +1,130 @@
-from dataclasses import dataclass
-from typing import List, Protocol, Union
+import copy
+import gzip
+import hashlib
+import itertools
+import os
+import pickle
+import shlex
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import (
+    BinaryIO,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Protocol,
+    Tuple,
+    Union,
+)
 
 import numpy as np
 import torch
 from biopandas import mmcif, mol2, pdb
 
 from .config import DTYPE
+from .periodictable import atomic_symbols, get_atomic_numbers
 
-__all__ = ["MolecularData", "MolecularParser", "Parser", "extract_binding_pocket"]
+__all__ = [
+    "MolecularData",
+    "MolecularParser",
+    "Parser",
+    "extract_binding_pocket",
+    "get_file_format",
+    "iter_mol2_atoms",
+    "iter_sdf_atoms",
+    "open_file",
+    "read_mmcif_atoms",
+    "read_pdb_atoms",
+]
 
 
-@dataclass
 class MolecularData:
-    """Dataclass for storing molecular info.
+    """Compact container for molecular info.
+
+    Elements are stored as atomic numbers (uint8), atom and residue names as byte
+    strings, and `__slots__` avoid a per-object dict, so thousands of objects can be
+    kept in memory and pickled cheaply. The biopandas object is only kept if requested
+    from the parser (`keep_object=True`).
 
     Args:
         molecule_object:
-            A biopandas molecule object (can be pdb, mol2 or mmcif)
+            A biopandas molecule object (can be pdb, mol2 or mmcif), or None if it
+            was not kept by the parser.
         coords:
             torch.Tensor of shape (3, n_atoms).
         element_symbols:
-            np.ndarray of shape (n_atoms,), type str.
+            np.ndarray of shape (n_atoms,), type str. Ignored if `atomic_numbers` is
+            given.
+        atomic_numbers:
+            np.ndarray of shape (n_atoms,), type uint8; 0 for unknown elements.
+        atom_names:
+            np.ndarray of shape (n_atoms,), type bytes (e.g. b"CA"), or None if the
+            file format has no atom names.
+        residue_names:
+            np.ndarray of shape (n_atoms,), type bytes (e.g. b"ALA"), or None if the
+            file format has no residue names.
     """
 
-    molecule_object: Union[mol2.PandasMol2, pdb.PandasPdb, mmcif.PandasMmcif]
-    coords: torch.Tensor
-    element_symbols: np.ndarray
+    __slots__ = (
+        "molecule_object",
+        "coords",
+        "atomic_numbers",
+        "atom_names",
+        "residue_names",
+    )
+
+    def __init__(
+        self,
+        molecule_object: Optional[
+            Union[mol2.PandasMol2, pdb.PandasPdb, mmcif.PandasMmcif]
+        ],
+        coords: torch.Tensor,
+        element_symbols: Optional[np.ndarray] = None,
+        atomic_numbers: Optional[np.ndarray] = None,
+        atom_names: Optional[np.ndarray] = None,
+        residue_names: Optional[np.ndarray] = None,
+    ):
+        if atomic_numbers is None:
+            atomic_numbers = get_atomic_numbers(element_symbols)
+        self.molecule_object = molecule_object
+        self.coords = torch.as_tensor(coords, dtype=DTYPE)
+        self.atomic_numbers = np.asarray(atomic_numbers, dtype=np.uint8)
+        self.atom_names = _as_names(atom_names)
+        self.residue_names = _as_names(residue_names)
+
+    @property
+    def element_symbols(self) -> np.ndarray:
+        """Get element symbols, np.ndarray of shape (n_atoms,), type str."""
+        return atomic_symbols[self.atomic_numbers]
+
+    def __repr__(self):
+        return "{}(n_atoms={}, molecule_object={})".format(
+            type(self).__name__,
+            self.coords.shape[1],
+            type(self.molecule_object).__name__,
+        )
+
+    def __getstate__(self):
+        return {k: getattr(self, k) for k in self.__slots__}
+
+    def __setstate__(self, state):
+        if "atomic_numbers" not in state:  # pickled by docktgrid <= 0.0.3
+            state = dict(state)
+            state["atomic_numbers"] = get_atomic_numbers(state["element_symbols"])
+        for k in self.__slots__:
+            setattr(self, k, state.get(k))
+
+
+def _as_names(names: Optional[np.ndarray]) -> Optional[np.ndarray]:
+    if names is None:
+        return None
+    names = np.asarray(names)
+    if names.dtype.kind == "U":
+        names = np.char.encode(names, "ascii")
+    return np.char.strip(names.astype("S"))
 
 
 class Parser(Protocol):
@@ -47,50 +146,613 @@ class Parser(Protocol):
         ...
 
 
+# bumped when the contents of MolecularData change, so old disk caches are not used
+_CACHE_VERSION = 2
+
+
 class MolecularParser:
-    """Get molecular info using biopandas."""
+    """Get molecular info using biopandas.
+
+    PDB and MOL2 files can also be read by a native parser (`backend="numpy"`), which
+    slices the atom records with NumPy and skips the biopandas DataFrames. It is much
+    faster, but `MolecularData.molecule_object` is always None. SDF files are always
+    read by the native parser.
+
+    The biopandas object holds DataFrames with every column of the file, so it is
+    dropped unless `keep_object=True`.
+
+    Files with many molecules (multi-MOL2 or SDF) can be streamed one molecule at a
+    time with `iter_molecules`; `parse_file` returns the first molecule only.
+
+    Parsed files can be cached (`cache_size`, `cache_dir`), e.g. when many ligands
+    share a receptor. Entries are keyed by file path, size and modification time, so
+    modified files are parsed again. Cached objects are shared between calls and must
+    not be modified in place.
+    """
+
+    BACKENDS = ("biopandas", "numpy")
+
+    def __init__(
+        self,
+        backend: str = "biopandas",
+        keep_object: bool = False,
+        cache_size: int = 0,
+        cache_dir: Optional[str] = None,
+    ):
+        """Initialize parser.
+
+        Args:
+            backend: Parser used for PDB and MOL2 files, "biopandas" (default) or
+                "numpy".
+            keep_object: Keep the biopandas object in `MolecularData.molecule_object`,
+                e.g. for custom views that need other columns of the file.
+            cache_size: Maximum number of parsed files kept in memory; the least
+                recently used ones are evicted first. If 0 (default), there is no
+                in-memory cache.
+            cache_dir: Directory where parsed files are also stored as pickles, to be
+                reused across processes and runs. If None (default), nothing is
+                stored on disk.
+        """
+        if backend not in self.BACKENDS:
+            raise NotImplementedError(f"Backend {backend} is not implemented yet.")
+        self.backend = backend
+        self.keep_object = keep_object
+        self.cache_size = cache_size
+        self.cache_dir = cache_dir
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
 
     def parse_file(self, mol_file: str, ext: str) -> MolecularData:
         """Parse molecular file and return a MolecularData object."""
-        self.ppdb = pdb.PandasPdb()
-        self.pmol2 = mol2.PandasMol2()
+        if self.cache_size <= 0 and self.cache_dir is None:
+            return self._parse_file(mol_file, ext)
+
+        stat = os.stat(mol_file)
+        key = (os.path.abspath(mol_file), ext, stat.st_size, stat.st_mtime_ns)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        if self.cache_dir is None:
+            mol = self._parse_file(mol_file, ext)
+        else:
+            mol = self._parse_file_with_disk_cache(mol_file, ext, key)
+
+        if self.cache_size > 0:
+            with self._lock:
+                self._cache[key] = mol
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return mol
+
+    def clear_cache(self) -> None:
+        """Remove all entries from the in-memory cache (the disk cache is kept)."""
+        with self._lock:
+            self._cache.clear()
 
-        if ext.lower() in ("pdb", ".pdb"):  # PDB file format
-            mol = self.ppdb.read_pdb(mol_file)
-            self.df_atom = mol.df["ATOM"]
-            self.df_hetatm = mol.df["HETATM"]
+    def _parse_file_with_disk_cache(self, mol_file, ext, key) -> MolecularData:
+        # files parsed with other options are stored separately
+        options = (self.backend, self.keep_object, _CACHE_VERSION)
+        digest = hashlib.sha1(repr((*key, *options)).encode())
+        cache_file = os.path.join(self.cache_dir, digest.hexdigest() + ".pkl")
+        if os.path.exists(cache_file):
+            with open(cache_file, "rb") as f:
+                return pickle.load(f)
+
+        mol = self._parse_file(mol_file, ext)
+        # write to a temporary file first, so that readers never see partial files
+        tmp_file = f"{cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file, "wb") as f:
+            pickle.dump(mol, f)
+        os.replace(tmp_file, cache_file)
+        return mol
+
+    def _parse_file(self, mol_file: str, ext: str) -> MolecularData:
+        # nothing is stored on `self`, so a parser can be shared between threads
+        fmt = get_file_format(mol_file, ext)
+        if fmt in ("pdb", "cif") and self.backend == "numpy":
+            read_atoms = read_pdb_atoms if fmt == "pdb" else read_mmcif_atoms
+            coords, symbols, atom_names, residue_names = read_atoms(mol_file, True)
             return MolecularData(
-                mol, self.get_coords_pdb(), self.get_element_symbols_pdb()
+                None,
+                torch.tensor(coords.T, dtype=DTYPE),
+                symbols,
+                atom_names=atom_names,
+                residue_names=residue_names,
             )
-        elif ext.lower() in ("mol2", ".mol2"):  # MOL2 file format
-            mol = self.pmol2.read_mol2(mol_file)
-            self.df_atom = mol.df
+        elif fmt == "pdb":  # PDB file format
+            mol = pdb.PandasPdb().read_pdb(mol_file)
             return MolecularData(
-                mol, self.get_coords_mol2(), self.get_element_symbols_mol2()
+                mol if self.keep_object else None,
+                self.get_coords_pdb(mol),
+                self.get_element_symbols_pdb(mol),
+                atom_names=self._get_column_pdb(mol, "atom_name"),
+                residue_names=self._get_column_pdb(mol, "residue_name"),
+            )
+        elif fmt == "cif":  # PDBx/mmCIF file format
+            mol = mmcif.PandasMmcif().read_mmcif(mol_file)
+            return MolecularData(
+                mol if self.keep_object else None,
+                self.get_coords_mmcif(mol),
+                self.get_element_symbols_mmcif(mol),
+                atom_names=self._get_column_pdb(mol, "label_atom_id"),
+                residue_names=self._get_column_pdb(mol, "label_comp_id"),
+            )
+        elif fmt == "sdf" or (fmt == "mol2" and self.backend == "numpy"):
+            return next(self.iter_molecules(mol_file, ext))
+        elif fmt == "mol2":  # MOL2 file format
+            mol = mol2.PandasMol2().read_mol2(mol_file)
+            residue_names = np.asarray(mol.df["subst_name"], dtype=str)
+            return MolecularData(
+                mol if self.keep_object else None,
+                self.get_coords_mol2(mol),
+                self.get_element_symbols_mol2(mol),
+                atom_names=np.asarray(mol.df["atom_name"], dtype=str),
+                residue_names=np.char.rstrip(residue_names, "0123456789"),
             )
         else:
             raise NotImplementedError(f"File format {ext} not implemented.")
 
-    def get_coords_pdb(self) -> torch.Tensor:
-        hetatm_coords = self.df_hetatm[["x_coord", "y_coord", "z_coord"]].values
-        atom_coords = self.df_atom[["x_coord", "y_coord", "z_coord"]].values
+    def parse_many(
+        self,
+        mol_files: List[str],
+        exts: Optional[List[str]] = None,
+        workers: Optional[int] = None,
+        executor: str = "process",
+    ) -> Tuple[List[Optional[MolecularData]], Dict[int, Exception]]:
+        """Parse many files in parallel.
+
+        Args:
+            mol_files: Full paths to the files.
+            exts: File extensions, one per file. If None (default), they are taken
+                from the file names.
+            workers: Number of workers. If None (default), the number of CPUs.
+            executor: "process" (default) or "thread". Processes scale with the
+                number of CPUs for every backend; threads avoid copying the results
+                between processes and fill the in-memory cache of this parser.
+
+        Returns:
+            A tuple with a list of MolecularData objects, in the order of `mol_files`
+            (None for files that could not be parsed), and a dict mapping the index
+            of each of those files to the exception raised.
+
+        """
+        mol_files = list(mol_files)
+        workers = workers or os.cpu_count()
+        chunksize = max(1, len(mol_files) // (4 * workers))
+        outputs = list(self.iter_many(mol_files, exts, workers, executor, chunksize))
+
+        results = [mol for mol, _ in outputs]
+        errors = {i: e for i, (_, e) in enumerate(outputs) if e is not None}
+        return results, errors
+
+    def iter_many(
+        self,
+        mol_files: Iterable[str],
+        exts: Optional[Iterable[str]] = None,
+        workers: Optional[int] = None,
+        executor: str = "process",
+        chunksize: int = 1,
+    ) -> Iterator[Tuple[Optional[MolecularData], Optional[Exception]]]:
+        """Parse many files in parallel, yielding the results in input order.
+
+        Files are taken from `mol_files` as workers need them, in chunks of
+        `chunksize` files with at most two chunks per worker in flight, so
+        `mol_files` may be a lazy iterable and only a few results are held in
+        memory at once.
+
+        Args:
+            mol_files: Full paths to the files.
+            exts: File extensions, one per file. If None (default), they are taken
+                from the file names.
+            workers: Number of workers. If None (default), the number of CPUs.
+            executor: "process" (default) or "thread", see `parse_many`.
+            chunksize: Number of files sent to a worker process at once (threads
+                always take one file at a time).
+
+        Yields:
+            A tuple (MolecularData, None) per file, or (None, exception) for files
+            that could not be parsed.
+
+        """
+        if executor not in ("process", "thread"):
+            raise NotImplementedError(f"Executor {executor} is not implemented yet.")
+        return self._iter_many(mol_files, exts, workers, executor, chunksize)
+
+    def _iter_many(self, mol_files, exts, workers, executor, chunksize):
+        workers = workers or os.cpu_count()
+        if executor == "process":
+            pool = ProcessPoolExecutor(workers)
+            # workers get their own copy of the parser, without the cached files
+            parser = copy.copy(self)
+            parser._cache = OrderedDict()
+        else:
+            pool = ThreadPoolExecutor(workers)
+            parser = self
+            chunksize = 1  # chunks only reduce inter-process communication
+
+        mol_files = iter(mol_files)
+        exts = None if exts is None else iter(exts)
+        pending = deque()
+        with pool:
+            while True:
+                while len(pending) < 2 * workers:
+                    files = list(itertools.islice(mol_files, chunksize))
+                    if not files:
+                        break
+                    if exts is None:
+                        file_exts = [os.path.splitext(f)[1] for f in files]
+                    else:
+                        file_exts = list(itertools.islice(exts, len(files)))
+                    pending.append(
+                        pool.submit(_try_parse_files, parser, files, file_exts)
+                    )
+                if not pending:
+                    return
+                yield from pending.popleft().result()
+
+    def iter_molecules(self, mol_file: str, ext: str) -> Iterator[MolecularData]:
+        """Parse the molecules of a multi-molecule file one at a time.
+
+        The file is read line by line and only the current molecule is kept in
+        memory, so files of any size can be streamed with constant memory.
+
+        Args:
+            mol_file: Full path to the file.
+            ext: File extension (file format), MOL2 or SDF, optionally gzipped.
+
+        Yields:
+            A MolecularData object per molecule, with `molecule_object` set to None
+            (and no residue names for SDF files).
+
+        """
+        fmt = get_file_format(mol_file, ext)
+        if fmt == "mol2":
+            iter_atoms = iter_mol2_atoms
+        elif fmt == "sdf":
+            iter_atoms = iter_sdf_atoms
+        else:
+            raise NotImplementedError(f"File format {ext} not implemented.")
+
+        with open_file(mol_file) as f:
+            for coords, symbols, *names in iter_atoms(f, names=True):
+                yield MolecularData(
+                    None,
+                    torch.tensor(coords.T, dtype=DTYPE),
+                    symbols,
+                    atom_names=names[0],
+                    residue_names=names[1],
+                )
+
+    @staticmethod
+    def get_coords_pdb(mol: pdb.PandasPdb) -> torch.Tensor:
+        hetatm_coords = mol.df["HETATM"][["x_coord", "y_coord", "z_coord"]].values
+        atom_coords = mol.df["ATOM"][["x_coord", "y_coord", "z_coord"]].values
         coords = np.concatenate((atom_coords, hetatm_coords), axis=0).T
         return torch.tensor(coords, dtype=DTYPE)
 
-    def get_element_symbols_pdb(self) -> List[str]:
-        hetatm_symbols = self.df_hetatm["element_symbol"].values
-        atom_symbols = self.df_atom["element_symbol"].values
+    @staticmethod
+    def get_element_symbols_pdb(mol: pdb.PandasPdb) -> List[str]:
+        hetatm_symbols = mol.df["HETATM"]["element_symbol"].values
+        atom_symbols = mol.df["ATOM"]["element_symbol"].values
         symbols = np.concatenate((atom_symbols, hetatm_symbols), axis=0)
         return symbols
 
-    def get_coords_mol2(self) -> torch.Tensor:
-        coords = self.df_atom[["x", "y", "z"]].values.T
-        return torch.tensor(coords, dtype=DTYPE)
+    @staticmethod
+    def get_coords_mmcif(mol: mmcif.PandasMmcif) -> torch.Tensor:
+        hetatm_coords = mol.df["HETATM"][["Cartn_x", "Cartn_y", "Cartn_z"]].values
+        atom_coords = mol.df["ATOM"][["Cartn_x", "Cartn_y", "Cartn_z"]].values
+        coords = np.concatenate((atom_coords, hetatm_coords), axis=0).T
+        return torch.tensor(coords.astype(np.float64), dtype=DTYPE)
 
-    def get_element_symbols_mol2(self) -> List[str]:
-        symbols = self.df_atom["atom_name"].values
+    @staticmethod
+    def get_element_symbols_mmcif(mol: mmcif.PandasMmcif) -> List[str]:
+        hetatm_symbols = np.asarray(mol.df["HETATM"]["type_symbol"], dtype=str)
+        atom_symbols = np.asarray(mol.df["ATOM"]["type_symbol"], dtype=str)
+        symbols = np.concatenate((atom_symbols, hetatm_symbols), axis=0)
         return symbols
 
+    @staticmethod
+    def _get_column_pdb(
+        mol: Union[pdb.PandasPdb, mmcif.PandasMmcif], column: str
+    ) -> np.ndarray:
+        # ATOM records first, as in the coords
+        values = [np.asarray(mol.df[k][column], dtype=str) for k in ("ATOM", "HETATM")]
+        return np.concatenate(values)
+
+    @staticmethod
+    def get_coords_mol2(mol: mol2.PandasMol2) -> torch.Tensor:
+        coords = mol.df[["x", "y", "z"]].values.T
+        return torch.tensor(coords, dtype=DTYPE)
+
+    @staticmethod
+    def get_element_symbols_mol2(mol: mol2.PandasMol2) -> List[str]:
+        # the element is the first part of the SYBYL atom type, e.g. "C" in "C.ar"
+        types = np.asarray(mol.df["atom_type"], dtype=str)
+        return np.char.partition(types, ".")[:, 0]
+
+
+def _try_parse_files(parser: MolecularParser, mol_files: List[str], exts: List[str]):
+    # module-level, so that it can be sent to worker processes
+    outputs = []
+    for mol_file, ext in zip(mol_files, exts):
+        try:
+            outputs.append((parser.parse_file(mol_file, ext), None))
+        except Exception as e:
+            outputs.append((None, e))
+    return outputs
+
+
+FILE_FORMATS = {
+    "pdb": "pdb",
+    "ent": "pdb",
+    "cif": "cif",
+    "mmcif": "cif",
+    "mol2": "mol2",
+    "sdf": "sdf",
+    "mol": "sdf",
+}
+
+
+def get_file_format(mol_file: str, ext: str) -> str:
+    """Get the file format from a file extension.
+
+    Gzipped files are identified by the extension before ".gz", so both
+    `ext=".gz"` and `ext=".pdb.gz"` give "pdb" for "protein.pdb.gz".
+
+    Args:
+        mol_file: Path to the file.
+        ext: File extension, with or without the leading dot.
+
+    Returns:
+        One of "pdb", "cif", "mol2" or "sdf", or `ext` (lowercase, without the dot)
+        if the format is unknown.
+
+    """
+    ext = ext.lower().lstrip(".")
+    if ext == "gz":
+        ext = os.path.splitext(mol_file[: -len(".gz")])[1].lower().lstrip(".")
+    elif ext.endswith(".gz"):
+        ext = ext[: -len(".gz")]
+    return FILE_FORMATS.get(ext, ext)
+
+
+def open_file(mol_file: str) -> BinaryIO:
+    """Open a file for reading in binary mode, decompressing gzipped files.
+
+    Gzipped files (".gz") are decompressed as they are read, without writing the
+    decompressed file to disk.
+
+    Args:
+        mol_file: Path to the file.
+
+    Returns:
+        A binary file object.
+
+    """
+    if mol_file.lower().endswith(".gz"):
+        return gzip.open(mol_file, "rb")
+    return open(mol_file, "rb")
+
+
+def read_pdb_atoms(mol_file: str, names: bool = False) -> Tuple[np.ndarray, ...]:
+    """Read the coords and element symbols of the atoms in a PDB file.
+
+    The file is read at once and the fixed PDB columns are sliced from a byte array,
+    without parsing the other fields. As with biopandas, ATOM records are listed
+    first, followed by HETATM records, each in file order.
+
+    Args:
+        mol_file: Path to the PDB file, optionally gzipped.
+        names: Also return the atom and residue names.
+
+    Returns:
+        A tuple with a np.ndarray of shape (n_atoms, 3), type float64, and a
+        np.ndarray of shape (n_atoms,), type str. If `names` is True, followed by
+        the atom and residue names, np.ndarrays of shape (n_atoms,), type bytes.
+
+    """
+    with open_file(mol_file) as f:
+        lines = np.array(f.read().splitlines(), dtype="S80")  # pad with null bytes
+    chars = lines.view(np.uint8).reshape(-1, 80)
+
+    records = chars[:, :6].copy().view("S6").ravel()
+    atoms = np.concatenate(
+        (np.flatnonzero(records == b"ATOM  "), np.flatnonzero(records == b"HETATM"))
+    )
+    chars = chars[atoms]
+
+    # columns 31-54 hold x, y and z, 8 characters each; 77-78 the element symbol
+    coords = chars[:, 30:54].copy().view("S8").astype(np.float64)
+    symbols = np.char.strip(chars[:, 76:78].copy().view("S2").ravel())
+    if not names:
+        return coords, symbols.astype(str)
+
+    # columns 13-16 hold the atom name, 18-20 the residue name
+    atom_names = np.char.strip(chars[:, 12:16].copy().view("S4").ravel())
+    residue_names = np.char.strip(chars[:, 17:20].copy().view("S3").ravel())
+    return coords, symbols.astype(str), atom_names, residue_names
+
+
+def read_mmcif_atoms(mol_file: str, names: bool = False) -> Tuple[np.ndarray, ...]:
+    """Read the coords and element symbols of the atoms in a PDBx/mmCIF file.
+
+    The file is streamed up to the end of the `_atom_site` loop, whose rows are split
+    into fields and converted with NumPy. As with biopandas, ATOM records are listed
+    first, followed by HETATM records, each in file order.
+
+    Args:
+        mol_file: Path to the mmCIF file, optionally gzipped.
+        names: Also return the atom and residue names (`label_atom_id` and
+            `label_comp_id`).
+
+    Returns:
+        A tuple with a np.ndarray of shape (n_atoms, 3), type float64, and a
+        np.ndarray of shape (n_atoms,), type str. If `names` is True, followed by
+        the atom and residue names, np.ndarrays of shape (n_atoms,), type bytes.
+
+    """
+    columns, rows = [], []
+    with open_file(mol_file) as f:
+        for line in f:
+            if line.startswith(b"_atom_site."):
+                columns.append(line.split()[0][len(b"_atom_site.") :].decode())
+            elif columns and line.startswith((b"#", b"_", b"loop_", b"data_")):
+                break  # end of the loop
+            elif columns and line.strip():
+                fields = line.split()
+                if len(fields) != len(columns):  # quoted values with spaces
+                    fields = [u.encode() for u in shlex.split(line.decode())]
+                rows.append(fields)
+
+    keys = ["group_PDB", "Cartn_x", "Cartn_y", "Cartn_z", "type_symbol"]
+    if names:
+        keys += ["label_atom_id", "label_comp_id"]
+    fields = np.array(rows, dtype="S").reshape(-1, len(columns))
+    fields = fields[:, [columns.index(k) for k in keys]]
+    atoms = np.concatenate(
+        (
+            np.flatnonzero(fields[:, 0] == b"ATOM"),
+            np.flatnonzero(fields[:, 0] == b"HETATM"),
+        )
+    )
+    coords = fields[atoms, 1:4].astype(np.float64)
+    if not names:
+        return coords, fields[atoms, 4].astype(str)
+    atom_names, residue_names = (_unquote(fields[atoms, i]) for i in (5, 6))
+    return coords, fields[atoms, 4].astype(str), atom_names, residue_names
+
+
+def _unquote(values: np.ndarray) -> np.ndarray:
+    # quoted CIF values without spaces, e.g. "O5'", keep their quotes after split()
+    for quote in (b'"', b"'"):
+        quoted = np.char.startswith(values, quote) & np.char.endswith(values, quote)
+        quoted &= np.char.str_len(values) > 1
+        values = np.where(quoted, np.char.strip(values, quote), values)
+    return values
+
+
+def iter_mol2_atoms(
+    f: BinaryIO, names: bool = False
+) -> Iterator[Tuple[np.ndarray, ...]]:
+    """Read the coords and element symbols of each molecule in a MOL2 file.
+
+    Element symbols are taken from the SYBYL atom types, e.g. "N" for "N.ar", and
+    residue names from the substructure names without their number, e.g. "ALA" for
+    "ALA12".
+
+    Args:
+        f: MOL2 file opened in binary mode.
+        names: Also return the atom and residue names.
+
+    Yields:
+        A tuple with a np.ndarray of shape (n_atoms, 3), type float64, and a
+        np.ndarray of shape (n_atoms,), type str, per molecule. If `names` is True,
+        followed by the atom and residue names, np.ndarrays of shape (n_atoms,), type
+        bytes.
+
+    """
+    lines, in_atoms, n_molecules = [], False, 0
+    for line in f:
+        if line.startswith(b"@<TRIPOS>"):
+            if line.startswith(b"@<TRIPOS>MOLECULE"):
+                if n_molecules > 0:
+                    yield _parse_mol2_atoms(lines, names)
+                lines, n_molecules = [], n_molecules + 1
+            in_atoms = line.startswith(b"@<TRIPOS>ATOM")
+        elif in_atoms and line.strip():
+            lines.append(line)
+    if n_molecules > 0:
+        yield _parse_mol2_atoms(lines, names)
+
+
+def _parse_mol2_atoms(lines: List[bytes], names: bool) -> Tuple[np.ndarray, ...]:
+    # atom_id atom_name x y z atom_type [subst_id [subst_name [charge [status]]]]
+    rows = [(line.split(None, 8)[:8] + [b""] * 2)[:8] for line in lines]
+    fields = np.array(rows, dtype="S").reshape(-1, 8)
+    coords = fields[:, 2:5].astype(np.float64)
+    symbols = np.char.partition(fields[:, 5], b".")[:, 0]
+    if not names:
+        return coords, symbols.astype(str)
+    residue_names = np.char.rstrip(fields[:, 7], b"0123456789")
+    return coords, symbols.astype(str), fields[:, 1], residue_names
+
+
+def iter_sdf_atoms(
+    f: BinaryIO, names: bool = False
+) -> Iterator[Tuple[np.ndarray, ...]]:
+    """Read the coords and element symbols of each molecule in a SDF (or MOL) file.
+
+    Both V2000 (fixed columns) and V3000 connection tables are supported.
+
+    Args:
+        f: SDF file opened in binary mode.
+        names: Also return the atom and residue names. SDF files have neither, so
+            both are None; accepted for symmetry with `iter_mol2_atoms`.
+
+    Yields:
+        A tuple with a np.ndarray of shape (n_atoms, 3), type float64, and a
+        np.ndarray of shape (n_atoms,), type str, per molecule, followed by two None
+        if `names` is True.
+
+    """
+    for atoms in _iter_sdf_atoms(f):
+        yield atoms + (None, None) if names else atoms
+
+
+def _iter_sdf_atoms(f: BinaryIO) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    while True:
+        header = [f.readline() for _ in range(4)]  # 3 header lines + counts line
+        counts = header[3]
+        if not counts.strip():
+            return
+
+        if b"V3000" in counts:
+            lines = []
+            for line in f:
+                if line.startswith(b"M  V30 BEGIN ATOM"):
+                    break
+            for line in f:
+                if line.startswith(b"M  V30 END ATOM"):
+                    break
+                lines.append(line)
+            yield _parse_sdf_v3000_atoms(lines)
+        else:
+            n_atoms = int(counts[:3])
+            yield _parse_sdf_v2000_atoms([f.readline() for _ in range(n_atoms)])
+
+        for line in f:  # skip bonds, properties and data items
+            if line.startswith(b"$$$$"):
+                break
+
+
+def _parse_sdf_v2000_atoms(lines: List[bytes]) -> Tuple[np.ndarray, np.ndarray]:
+    # x, y and z take 10 characters each, followed by a space and the symbol
+    chars = np.array(lines, dtype="S80").view(np.uint8).reshape(-1, 80)
+    coords = chars[:, :30].copy().view("S10").astype(np.float64)
+    symbols = np.char.strip(chars[:, 31:34].copy().view("S3").ravel())
+    return coords, symbols.astype(str)
+
+
+def _parse_sdf_v3000_atoms(lines: List[bytes]) -> Tuple[np.ndarray, np.ndarray]:
+    # M  V30 index type x y z aamap [properties]
+    fields = np.array([line.split(None, 7)[3:7] for line in lines], dtype="S").reshape(
+        -1, 4
+    )
+    return fields[:, 1:].astype(np.float64), fields[:, 0].astype(str)
+
 
 def extract_binding_pocket(protein_coords, center_point, cutoff_radius):
     """Extract the binding pocket from the protein coordinates.
@@ -101,7 +763,7 @@ def extract_binding_pocket(protein_coords, center_point, cutoff_radius):
         center_point:
             torch.Tensor of shape (3,).
         cutoff_radius:
-            float.
+            float, or torch.Tensor of shape (n_atoms,) with a radius per atom.
 
     Returns:
         A torch.Tensor of shape (n_included_atoms,) with the indices of the binding
@@ -109,4 +771,4 @@ def extract_binding_pocket(protein_coords, center_point, cutoff_radius):
 
     """
     dists = torch.norm(protein_coords - center_point[:, None], dim=0)
-    return (dists < cutoff_radius).nonzero().squeeze()
+    return (dists < cutoff_radius).nonzero().squeeze(1)
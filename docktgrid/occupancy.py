@@ -0,0 +1,180 @@
+import abc
+import math
+from typing import Union
+
+import torch
+
+from docktgrid.config import DEVICE, DTYPE
+
+__all__ = [
+    "OccupancyModel",
+    "VdwOccupancy",
+    "LookupOccupancy",
+    "BinaryOccupancy",
+    "GaussianOccupancy",
+    "get_occupancy_model",
+    "vdw_cutoff",
+]
+
+
+def vdw_cutoff(tol: float) -> float:
+    """Get the interaction cutoff for the vdW occupancy model.
+
+    The occupancy `1 - exp(-(vdw / dist)^12)` is smaller than `tol` whenever
+    `dist > cutoff * vdw`.
+
+    Args:
+        tol: Occupancy tolerance, must be in the open interval (0, 1).
+
+    Returns:
+        The cutoff as a multiple of the vdW radius.
+
+    """
+    _check_tol(tol)
+    return (-math.log1p(-tol)) ** (-1 / 12)
+
+
+def _check_tol(tol: float):
+    if not 0 < tol < 1:
+        raise ValueError(f"`tol` must be in the interval (0, 1), got {tol}.")
+
+
+class OccupancyModel(metaclass=abc.ABCMeta):
+    """Interface for occupancy models.
+
+    An occupancy model gives the contribution of an atom to a voxel as a function of
+    the squared ratio between their distance and the atom vdW radius, i.e.:
+    `ratio2 = (dist / vdw)^2`.
+    """
+
+    @abc.abstractmethod
+    def __call__(self, ratio2: torch.Tensor) -> torch.Tensor:
+        """Compute occupancies.
+
+        Args:
+            ratio2: torch.Tensor with squared distance/vdW radius ratios.
+
+        Returns:
+            A torch.Tensor with the same shape as `ratio2`, with values in [0, 1].
+
+        """
+        pass
+
+    @abc.abstractmethod
+    def get_cutoff(self, tol: float) -> float:
+        """Get the interaction cutoff for a given tolerance.
+
+        Args:
+            tol: Occupancy tolerance, must be in the open interval (0, 1).
+
+        Returns:
+            The cutoff as a multiple of the vdW radius, beyond which occupancies are
+            smaller than `tol`.
+
+        """
+        pass
+
+
+class VdwOccupancy(OccupancyModel):
+    """Occupancy `1 - exp(-(vdw / dist)^12)`."""
+
+    def __call__(self, ratio2: torch.Tensor) -> torch.Tensor:
+        return 1 - torch.exp(-1 * torch.pow(ratio2, -6))
+
+    def get_cutoff(self, tol: float) -> float:
+        return vdw_cutoff(tol)
+
+
+class LookupOccupancy(OccupancyModel):
+    """Tabulated occupancy model, evaluated with linear interpolation.
+
+    The table samples another model at `resolution` evenly spaced values of `ratio2`
+    in [0, cutoff^2], with `cutoff` taken at tolerance `tol`. Occupancies beyond the
+    table are zero.
+    """
+
+    def __init__(
+        self,
+        model: OccupancyModel = VdwOccupancy(),
+        resolution: int = 4096,
+        tol: float = 1e-6,
+    ):
+        """Initialize lookup table.
+
+        Args:
+            model: Occupancy model to tabulate.
+            resolution: Number of samples in the table.
+            tol: Occupancy tolerance used to choose the extent of the table.
+        """
+        self.model = model
+        self.tol = tol
+        self.max_ratio2 = model.get_cutoff(tol) ** 2
+        self.scale = (resolution - 1) / self.max_ratio2
+
+        samples = torch.linspace(0, self.max_ratio2, resolution, dtype=torch.float64)
+        table = model(samples)
+        # pad with zeros, the value beyond the table
+        table = torch.cat((table, table.new_zeros(2)))
+        self.resolution = resolution
+        self.table = table[:-1].to(dtype=DTYPE, device=DEVICE)
+        self.slopes = torch.diff(table).to(dtype=DTYPE, device=DEVICE)
+
+    def __call__(self, ratio2: torch.Tensor) -> torch.Tensor:
+        x = torch.clamp_(ratio2 * self.scale, max=self.resolution)
+        index = x.long()
+        weight = x.sub_(index)
+
+        occs = torch.take(self.slopes.to(ratio2.device), index).mul_(weight)
+        return occs.add_(torch.take(self.table.to(ratio2.device), index))
+
+    def get_cutoff(self, tol: float) -> float:
+        _check_tol(tol)
+        return min(self.model.get_cutoff(tol), math.sqrt(self.max_ratio2))
+
+
+class BinaryOccupancy(OccupancyModel):
+    """Hard-sphere occupancy: 1 inside the vdW radius, 0 outside."""
+
+    def __call__(self, ratio2: torch.Tensor) -> torch.Tensor:
+        return (ratio2 <= 1).to(dtype=DTYPE)
+
+    def get_cutoff(self, tol: float) -> float:
+        _check_tol(tol)
+        return 1.0
+
+
+class GaussianOccupancy(OccupancyModel):
+    """Gaussian occupancy `exp(-2 * (dist / vdw)^2)`."""
+
+    def __call__(self, ratio2: torch.Tensor) -> torch.Tensor:
+        return torch.exp(-2 * ratio2)
+
+    def get_cutoff(self, tol: float) -> float:
+        _check_tol(tol)
+        return math.sqrt(-math.log(tol) / 2)
+
+
+def get_occupancy_model(occ: Union[str, OccupancyModel]) -> OccupancyModel:
+    """Get occupancy model by name.
+
+    Args:
+        occ: One of "vdw", "vdw_lut", "binary" or "gaussian", or an OccupancyModel.
+
+    Returns:
+        An OccupancyModel object.
+
+    """
+    if isinstance(occ, OccupancyModel):
+        return occ
+    elif occ == "vdw":
+        return VdwOccupancy()
+    elif occ == "vdw_lut":
+        return LookupOccupancy(VdwOccupancy())
+    elif occ == "binary":
+        return BinaryOccupancy()
+    elif occ == "gaussian":
+        return GaussianOccupancy()
+    else:
+        raise NotImplementedError(
+            f"Occupancy function for {occ} is not implemented yet."
+        )
@@ -2,6 +2,9 @@
 Periodic table of elements with relevant properties.
 """
 
+import numpy as np
+import torch
+
 ptable = {
     "H": {"name": "hydrogen", "num": 1, "mass": 1.00794, "vdw": 1.1},
     "He": {"name": "helium", "num": 2, "mass": 4.002602, "vdw": 1.4},
@@ -122,3 +125,53 @@ ptable = {
     "Ts": {"name": "tennessine", "num": 117, "mass": 294, "vdw": None},
     "Og": {"name": "oganesson", "num": 118, "mass": 294, "vdw": None},
 }
+
+# element symbols indexed by atomic number, "X" (0) stands for unknown elements
+atomic_symbols = np.array(["X", *sorted(ptable, key=lambda k: ptable[k]["num"])])
+_atomic_numbers = {k: v["num"] for k, v in ptable.items()}
+
+
+def _get_property_table(prop: str) -> np.ndarray:
+    values = [ptable[k][prop] for k in atomic_symbols[1:]]
+    return np.array([np.nan] + [np.nan if v is None else v for v in values], np.float32)
+
+
+# property tables indexed by atomic number, NaN if unknown; `torch.from_numpy` gives
+# torch tables sharing the same memory
+atomic_masses = _get_property_table("mass")
+vdw_radii = _get_property_table("vdw")
+
+
+def get_atomic_numbers(symbols) -> np.ndarray:
+    """Get the atomic numbers of element symbols.
+
+    Symbols are case insensitive and surrounding whitespace is ignored. Only the
+    distinct symbols are looked up, so the cost is independent of the number of atoms.
+
+    Args:
+        symbols: Array-like of element symbols, type str.
+
+    Returns:
+        A np.ndarray with the same shape as `symbols`, type uint8; unknown symbols
+        get atomic number 0.
+
+    """
+    symbols = np.asarray(symbols, dtype=str)
+    unique, inverse = np.unique(symbols, return_inverse=True)
+    numbers = [_atomic_numbers.get(u.strip().title(), 0) for u in unique]
+    return np.array(numbers, dtype=np.uint8)[inverse].reshape(symbols.shape)
+
+
+def get_vdw_radii(atomic_numbers) -> torch.Tensor:
+    """Get the vdW radii of atoms with a single lookup in the `vdw_radii` table.
+
+    Args:
+        atomic_numbers: Array-like of atomic numbers.
+
+    Returns:
+        A torch.Tensor with the same shape as `atomic_numbers`, type float32; NaN for
+        elements without a known vdW radius.
+
+    """
+    index = torch.as_tensor(np.asarray(atomic_numbers), dtype=torch.long)
+    return torch.from_numpy(vdw_radii)[index]
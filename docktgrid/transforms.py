@@ -23,6 +23,21 @@ class RandomRotation:
         rotation = Rotation.random().as_matrix()
         return torch.from_numpy(rotation).to(dtype=DTYPE)
 
+    def get_matrices(self, n: int) -> torch.Tensor:
+        """Get `n` random rotation matrices.
+
+        The matrices can be voxelized at once with `VoxelGrid.voxelize_rotations`.
+
+        Args:
+            n: Number of rotations.
+
+        Returns:
+            A torch.Tensor of shape (n, 3, 3).
+
+        """
+        rotations = Rotation.random(n).as_matrix()
+        return torch.from_numpy(rotations).to(dtype=DTYPE)
+
     def __call__(
         self, coords: torch.Tensor, ligand_center: torch.Tensor
     ) -> Optional[Tuple[torch.Tensor]]:
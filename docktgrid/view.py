@@ -1,11 +1,65 @@
 import abc
+from typing import Dict, List, Optional, Union
 
 import numpy as np
 import torch
 
 from docktgrid.molecule import MolecularComplex
+from docktgrid.periodictable import atomic_symbols, get_atomic_numbers
 
-__all__ = ["View", "VolumeView", "BasicView"]
+__all__ = [
+    "View",
+    "VolumeView",
+    "BasicView",
+    "TableView",
+    "pack_channels",
+    "unpack_channels",
+]
+
+# channels are packed in the bits of int64 words, leaving the sign bit unused
+BITS_PER_WORD = 63
+
+
+def pack_channels(mask) -> torch.Tensor:
+    """Pack a channels mask into a bitmask per atom.
+
+    Channel `i` is bit `i % 63` of word `i // 63`, so up to 63 channels take a single
+    int64 per atom, instead of one bool per channel and atom.
+
+    Args:
+        mask: A boolean torch.Tensor of shape (n_channels, n_atoms).
+
+    Returns:
+        A torch.Tensor of shape (n_words, n_atoms), type int64, with
+        `n_words = max(1, ceil(n_channels / 63))`.
+
+    """
+    mask = torch.as_tensor(mask, dtype=torch.bool)
+    n_channels, n_atoms = mask.shape
+    n_words = max(1, -(-n_channels // BITS_PER_WORD))
+
+    bits = torch.zeros((n_words, n_atoms), dtype=torch.int64, device=mask.device)
+    for i in range(n_channels):
+        w, bit = divmod(i, BITS_PER_WORD)
+        bits[w] |= mask[i].long() << bit
+    return bits
+
+
+def unpack_channels(bits: torch.Tensor, n_channels: int) -> torch.Tensor:
+    """Unpack the bitmasks of `pack_channels` into a channels mask.
+
+    Args:
+        bits: A torch.Tensor of shape (n_words, n_atoms), type int64.
+        n_channels: Number of channels.
+
+    Returns:
+        A boolean torch.Tensor of shape (n_channels, n_atoms).
+
+    """
+    shifts = torch.arange(BITS_PER_WORD, device=bits.device)[:, None]
+    mask = torch.bitwise_and(bits[:, None, :] >> shifts, 1)
+    mask = mask.reshape(bits.shape[0] * BITS_PER_WORD, bits.shape[1])
+    return mask[:n_channels].bool()
 
 
 class View(metaclass=abc.ABCMeta):
@@ -14,8 +68,14 @@ class View(metaclass=abc.ABCMeta):
     Note that the atoms in the returning boolean matrices should follow the order they
     appear in the PDB file. The atoms from the protein are listed first, followed by
     those from the ligand.
+
+    Views whose channels only depend on the atoms of the complex, and not on their
+    coordinates, should set `cacheable = True`: their masks are then computed once per
+    complex and reused, e.g. across rotations (see `VoxelGrid.get_channels_mask`).
     """
 
+    cacheable = False
+
     @abc.abstractmethod
     def get_num_channels(self):
         """Return number of channels defined for the view.
@@ -100,6 +160,20 @@ class View(metaclass=abc.ABCMeta):
             ),
         )
 
+    def get_channels_bits(self, molecular_complex: MolecularComplex) -> torch.Tensor:
+        """Get the channels of each atom as packed bitmasks (see `pack_channels`).
+
+        Views can override it to build the bitmasks without the boolean matrix.
+
+        Args:
+            molecular_complex: MolecularComplex object.
+
+        Returns:
+            A torch.Tensor of shape (n_words, n_atoms_complex), type int64.
+
+        """
+        return pack_channels(self(molecular_complex))
+
 
 class VolumeView(View):
     """Default volume channel sets.
@@ -108,6 +182,8 @@ class VolumeView(View):
     in a single channel.
     """
 
+    cacheable = True
+
     def get_num_channels(self):
         return sum((1, 1, 1))
 
@@ -141,6 +217,13 @@ class BasicView(View):
         carbon, hydrogen, oxygen, nitrogen, sulfur, x*.
     """
 
+    # channels of each element, indexed by atomic number; the last channel is x*
+    ELEMENTS_TABLE = np.zeros((6, len(atomic_symbols)), dtype=bool)
+    ELEMENTS_TABLE[range(5), [6, 1, 8, 7, 16]] = True  # C, H, O, N, S
+    ELEMENTS_TABLE[5] = ~np.any(ELEMENTS_TABLE[:5], axis=0)
+
+    cacheable = True
+
     def get_num_channels(self):
         return sum((6, 6, 6))
 
@@ -156,24 +239,8 @@ class BasicView(View):
         self, molecular_complex: MolecularComplex
     ) -> torch.Tensor:
         """Set of channels for all atoms."""
-
-        channels = {
-            0: ["C"],
-            1: ["H"],
-            2: ["O"],
-            3: ["N"],
-            4: ["S"],
-            5: ["C", "H", "O", "N", "S"],
-        }
-        nchs = len(channels)
-
-        # get a list of bools representing each atom in each channel
-        symbs = molecular_complex.element_symbols
-        chs = np.asarray([np.isin(symbs, channels[c]) for c in range(nchs)])
-
-        # invert bools in last channel, since it represents any atom except CHONS
-        np.invert(chs[-1], out=chs[-1])
-
+        # one lookup in a (n_channels, n_elements) table indexed by atomic number
+        chs = self.ELEMENTS_TABLE[:, molecular_complex.atomic_numbers]
         return torch.from_numpy(chs)
 
     def get_ligand_channels(self, molecular_complex: MolecularComplex) -> torch.Tensor:
@@ -191,3 +258,237 @@ class BasicView(View):
         # exclude ligand atoms from protein channels
         chs[..., -molecular_complex.n_atoms_ligand :] = False
         return chs
+
+    def __call__(self, molecular_complex: MolecularComplex) -> torch.Tensor:
+        # look up the table once, then split it into the protein and ligand sets
+        chs = self.get_molecular_complex_channels(molecular_complex)
+        n_protein = molecular_complex.n_atoms_protein
+
+        out = torch.zeros((3 * len(chs), chs.shape[1]), dtype=torch.bool)
+        out[: len(chs)] = chs
+        out[len(chs) : 2 * len(chs), :n_protein] = chs[:, :n_protein]
+        out[2 * len(chs) :, n_protein:] = chs[:, n_protein:]
+        return out
+
+    def get_channels_bits(self, molecular_complex: MolecularComplex) -> torch.Tensor:
+        table = np.concatenate([self.ELEMENTS_TABLE] * 3)
+        sizes = [len(self.ELEMENTS_TABLE)] * 3
+        return _gather_channels_bits(
+            table,
+            molecular_complex.atomic_numbers,
+            sizes,
+            molecular_complex.n_atoms_protein,
+        )
+
+
+class TableView(View):
+    """View defined by declarative rules, compiled into a lookup table.
+
+    Channels are given for each set (complex, protein and ligand) as a dict mapping
+    channel names to rules. A rule is a dict with any of the keys "element",
+    "residue" and "atom" (atom name), each a name or a list of names; an atom
+    matches a rule if it matches all of its keys. A channel can also be a list of
+    rules, and then holds the atoms matching any of them. For example::
+
+        TableView(
+            protein={
+                "carbon": {"element": "C"},
+                "backbone": {"atom": ["N", "CA", "C", "O"]},
+                "donor": [
+                    {"residue": "ARG", "atom": ["NE", "NH1", "NH2"]},
+                    {"residue": "LYS", "atom": "NZ"},
+                ],
+            },
+            ligand={"heavy": {"element": ["C", "N", "O", "S", "P"]}},
+        )
+
+    Rules are evaluated once per distinct atom type, i.e. (element, residue, atom
+    name) tuple, of a complex, and the resulting (n_channels, n_types) table is
+    gathered with the type code of each atom. Rules on elements only are tabulated
+    over atomic numbers when the view is created. Residue and atom names are those
+    of `MolecularComplex`, so residue and atom rules do not match atoms read from
+    files without them (e.g. SDF).
+    """
+
+    cacheable = True
+
+    SETS = ("complex", "protein", "ligand")
+    KEYS = ("element", "residue", "atom")
+
+    def __init__(
+        self,
+        complex: Optional[Dict[str, Union[dict, List[dict]]]] = None,
+        protein: Optional[Dict[str, Union[dict, List[dict]]]] = None,
+        ligand: Optional[Dict[str, Union[dict, List[dict]]]] = None,
+    ):
+        """Compile the rules of the view.
+
+        Args:
+            complex: Channels for all atoms of the complex.
+            protein: Channels for protein atoms only.
+            ligand: Channels for ligand atoms only.
+        """
+        self.specs = {
+            "complex": complex or {},
+            "protein": protein or {},
+            "ligand": ligand or {},
+        }
+
+        # one list of compiled rules per channel, for all sets in order
+        self._channels = [
+            [
+                self._compile_rule(r)
+                for r in (rules if isinstance(rules, list) else [rules])
+            ]
+            for spec in self.specs.values()
+            for rules in spec.values()
+        ]
+        self._keys = sorted(
+            {k for rules in self._channels for rule in rules for k in rule},
+            key=self.KEYS.index,
+        )
+        self._table = None
+        if self._keys in ([], ["element"]):  # atom types are the atomic numbers
+            numbers = np.arange(len(atomic_symbols), dtype=np.uint8)
+            self._table = self._evaluate({"element": numbers})
+
+    def _compile_rule(self, rule: dict) -> dict:
+        unknown = set(rule) - set(self.KEYS)
+        if unknown:
+            raise ValueError(
+                f"Unknown keys in view rule: {', '.join(sorted(unknown))}."
+            )
+
+        compiled = {}
+        for key, names in rule.items():
+            names = np.atleast_1d(np.asarray(names, dtype=str))
+            if key == "element":
+                numbers = get_atomic_numbers(names)
+                if not np.all(numbers):
+                    symbols = ", ".join(names[numbers == 0])
+                    raise ValueError(f"Unknown elements in view rule: {symbols}.")
+                compiled[key] = numbers
+            else:
+                compiled[key] = np.char.encode(np.char.strip(names), "ascii")
+        return compiled
+
+    def _evaluate(self, types: Dict[str, np.ndarray]) -> np.ndarray:
+        # (n_channels, n_types) table of the atom types in each channel
+        n_types = len(next(iter(types.values())))
+        table = np.zeros((len(self._channels), n_types), dtype=bool)
+        for i, rules in enumerate(self._channels):
+            for rule in rules:
+                match = np.ones(n_types, dtype=bool)
+                for key, names in rule.items():
+                    match &= np.isin(types[key], names)
+                table[i] |= match
+        return table
+
+    def get_num_channels(self):
+        return len(self._channels)
+
+    def get_channels_names(self):
+        return [
+            f"{name}_{set_name}"
+            for set_name in self.SETS
+            for name in self.specs[set_name]
+        ]
+
+    def get_molecular_complex_channels(
+        self, molecular_complex: MolecularComplex
+    ) -> torch.Tensor:
+        return self._get_set_channels(molecular_complex, "complex")
+
+    def get_protein_channels(self, molecular_complex: MolecularComplex) -> torch.Tensor:
+        return self._get_set_channels(molecular_complex, "protein")
+
+    def get_ligand_channels(self, molecular_complex: MolecularComplex) -> torch.Tensor:
+        return self._get_set_channels(molecular_complex, "ligand")
+
+    def _get_set_channels(self, molecular_complex, set_name):
+        sizes = [len(self.specs[k]) for k in self.SETS]
+        start = sum(sizes[: self.SETS.index(set_name)])
+        return self(molecular_complex)[start : start + len(self.specs[set_name])]
+
+    def __call__(self, molecular_complex: MolecularComplex) -> torch.Tensor:
+        if self._table is not None:
+            table, codes = self._table, molecular_complex.atomic_numbers
+        else:
+            table, codes = self._get_types_table(molecular_complex)
+        chs = table[:, codes]
+
+        # restrict the protein and ligand sets to their atoms
+        n_protein = molecular_complex.n_atoms_protein
+        n_complex = len(self.specs["complex"])
+        n_protein_chs = len(self.specs["protein"])
+        chs[n_complex : n_complex + n_protein_chs, n_protein:] = False
+        chs[n_complex + n_protein_chs :, :n_protein] = False
+        return torch.from_numpy(chs)
+
+    def get_channels_bits(self, molecular_complex: MolecularComplex) -> torch.Tensor:
+        if self._table is not None:
+            table, codes = self._table, molecular_complex.atomic_numbers
+        else:
+            table, codes = self._get_types_table(molecular_complex)
+        sizes = [len(self.specs[k]) for k in self.SETS]
+        return _gather_channels_bits(
+            table, codes, sizes, molecular_complex.n_atoms_protein
+        )
+
+    def _get_types_table(self, molecular_complex):
+        columns = {
+            "element": molecular_complex.atomic_numbers,
+            "residue": molecular_complex.residue_names,
+            "atom": molecular_complex.atom_names,
+        }
+        columns = [(k, columns[k]) for k in self._keys]
+
+        # pack the columns of each atom in a row of bytes, so that the distinct atom
+        # types are found by sorting a single array (integers for up to 8 bytes)
+        width = sum(v.itemsize for _, v in columns)
+        width = -(-width // 8) * 8
+        packed = np.zeros((molecular_complex.n_atoms, width), dtype=np.uint8)
+        offsets = [0]
+        for _, values in columns:
+            itemsize = values.itemsize
+            packed[:, offsets[-1] : offsets[-1] + itemsize] = values.view(
+                np.uint8
+            ).reshape(-1, itemsize)
+            offsets.append(offsets[-1] + itemsize)
+
+        dtype = np.int64 if width == 8 else np.dtype((np.void, width))
+        types, codes = np.unique(packed.view(dtype).ravel(), return_inverse=True)
+        types = types.view(np.uint8).reshape(-1, width)
+        table = self._evaluate(
+            {
+                k: types[:, start:end].copy().view(v.dtype).ravel()
+                for (k, v), start, end in zip(columns, offsets, offsets[1:])
+            }
+        )
+        return table, codes.ravel()
+
+
+def _gather_channels_bits(table, codes, sizes, n_protein) -> torch.Tensor:
+    """Gather the packed channels of each atom from a table of atom types.
+
+    Args:
+        table: A boolean np.ndarray of shape (n_channels, n_types).
+        codes: A np.ndarray of shape (n_atoms,) with the type of each atom.
+        sizes: Number of channels in the complex, protein and ligand sets.
+        n_protein: Number of protein atoms.
+
+    Returns:
+        A torch.Tensor of shape (n_words, n_atoms), type int64.
+
+    """
+    bits = pack_channels(torch.from_numpy(table))
+    bits = bits[:, torch.from_numpy(codes.astype(np.int64))]
+
+    # restrict the protein and ligand sets to their atoms
+    n_complex, n_protein_chs, _ = sizes
+    protein, ligand = torch.zeros((2, sum(sizes), 1), dtype=torch.bool)
+    protein[n_complex : n_complex + n_protein_chs] = True
+    ligand[n_complex + n_protein_chs :] = True
+    bits[:, n_protein:] &= ~pack_channels(protein)
+    bits[:, :n_protein] &= ~pack_channels(ligand)
+    return bits
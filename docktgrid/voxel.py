@@ -1,12 +1,163 @@
-from typing import List
+import bisect
+import math
+from typing import List, Optional, Union
 
 import torch
 
 from docktgrid.config import DEVICE, DTYPE
 from docktgrid.grid import Grid3D
-from docktgrid.view import View
+from docktgrid.occupancy import OccupancyModel, get_occupancy_model
+from docktgrid.view import BITS_PER_WORD, View, pack_channels, unpack_channels
 
-__all__ = ["VoxelGrid"]
+__all__ = [
+    "VoxelGrid",
+    "densify",
+    "dequantize",
+    "get_channel_segments",
+    "to_sparse",
+]
+
+# occupancy tolerance used by engines that need a finite cutoff if none is given
+DEFAULT_TOL = 1e-6
+
+# uint8 voxel grids store occupancies in [0, 1] as integers in [0, UINT8_SCALE]
+UINT8_SCALE = 255
+
+# bits of a word of packed channels
+WORD_MASK = (1 << BITS_PER_WORD) - 1
+
+
+def _cast_occupancies(occs: torch.Tensor, dtype: torch.dtype) -> torch.Tensor:
+    """Cast occupancies to the output dtype, quantizing them for uint8 outputs."""
+    if dtype == torch.uint8:
+        return torch.round(occs * UINT8_SCALE).to(dtype)
+    return occs.to(dtype)
+
+
+def dequantize(voxels: torch.Tensor, dtype: torch.dtype = DTYPE) -> torch.Tensor:
+    """Convert a voxel grid of any output dtype to floating point occupancies.
+
+    Args:
+        voxels: A voxel grid, e.g. from `VoxelGrid.voxelize`.
+        dtype: Floating point dtype of the result.
+
+    Returns:
+        A torch.Tensor with occupancies in [0, 1].
+
+    """
+    if voxels.dtype == torch.uint8:
+        return voxels.to(dtype) / UINT8_SCALE
+    return voxels.to(dtype)
+
+
+def to_sparse(voxels: torch.Tensor, threshold: float = 0.0) -> torch.Tensor:
+    """Convert a voxel grid to a sparse COO tensor.
+
+    Args:
+        voxels: A voxel grid, e.g. from `VoxelGrid.voxelize`.
+        threshold: Occupancies smaller than or equal to `threshold` are dropped. For
+            uint8 grids it is given in occupancy units, i.e. in [0, 1].
+
+    Returns:
+        A coalesced sparse torch.Tensor with the same shape and dtype as `voxels`.
+
+    """
+    if voxels.dtype == torch.uint8:
+        threshold = threshold * UINT8_SCALE
+
+    mask = voxels > threshold
+    indices = torch.nonzero(mask).T  # nonzero returns indices in row-major order
+    return torch.sparse_coo_tensor(
+        indices,
+        voxels[mask],
+        voxels.shape,
+        is_coalesced=True,
+        check_invariants=False,
+    )
+
+
+def densify(voxels: torch.Tensor, out: Optional[torch.Tensor] = None) -> torch.Tensor:
+    """Convert a sparse voxel grid back to a dense tensor.
+
+    Args:
+        voxels: A sparse COO tensor, e.g. from `VoxelGrid.voxelize_sparse`.
+        out: Alternate output tensor in which to place the result; it must have the
+            same shape and dtype as `voxels` and is overwritten.
+
+    Returns:
+        A dense torch.Tensor.
+
+    """
+    if out is None:
+        out = torch.zeros(voxels.shape, dtype=voxels.dtype, device=voxels.device)
+    else:
+        out.zero_()
+
+    voxels = voxels if voxels.is_coalesced() else voxels.coalesce()
+    out[tuple(voxels.indices())] = voxels.values()
+    return out
+
+
+def get_channel_segments(channels, n_channels: Optional[int] = None):
+    """Group atoms by the set of channels they belong to.
+
+    Atoms in the same group have exactly the same channel membership, so a channel is
+    the union of a few groups. Atoms that belong to no channel are left out. Groups
+    are found by sorting the packed bitmask of each atom (one integer for up to 63
+    channels), rather than the rows of the boolean mask.
+
+    Args:
+        channels: A boolean torch.Tensor of shape (n_channels, n_atoms), or packed
+            bitmasks of shape (n_words, n_atoms) (see `pack_channels`).
+        n_channels: Number of channels, required for packed bitmasks.
+
+    Returns:
+        A tuple (order, offsets, groups), where `order` is a torch.Tensor with atom
+        indices sorted by group, so the atoms of group g are
+        `order[offsets[g]:offsets[g + 1]]`, and `groups` is a boolean torch.Tensor of
+        shape (n_groups, n_channels) with the channels of each group.
+
+    """
+    if n_channels is None:
+        n_channels = len(channels)
+        channels = pack_channels(channels)
+
+    if channels.shape[0] == 1:
+        keys, inverse = torch.unique(channels[0], return_inverse=True)
+        keys = keys[None]
+    else:
+        keys, inverse = torch.unique(channels.T, dim=0, return_inverse=True)
+        keys = keys.T.reshape(channels.shape[0], -1)  # keep shape if there are no atoms
+    groups = unpack_channels(keys, n_channels).T
+
+    order = torch.argsort(inverse, stable=True)
+    counts = torch.bincount(inverse, minlength=groups.shape[0])
+
+    nonempty = torch.any(keys != 0, dim=0)
+    order = order[nonempty[inverse[order]]]
+    groups, counts = groups[nonempty], counts[nonempty]
+    offsets = torch.cat((counts.new_zeros(1), torch.cumsum(counts, 0)))
+
+    return order, offsets, groups
+
+
+def _get_atom_tiles(offsets: List[int], atom_tile: int) -> List[int]:
+    """Split packed atoms in tiles of at most `atom_tile` atoms.
+
+    Tiles end at the boundaries of the groups (`offsets`), unless a group alone is
+    larger than a tile. Returns the bounds of the tiles, tile t holds atoms
+    [bounds[t], bounds[t + 1]).
+
+    """
+    bounds = [0]
+    for prev, end in zip(offsets[:-1], offsets[1:]):
+        if end - bounds[-1] > atom_tile and prev > bounds[-1]:
+            bounds.append(prev)  # close the tile before this group
+        while end - bounds[-1] > atom_tile:
+            bounds.append(bounds[-1] + atom_tile)  # split a large group
+    if bounds[-1] < offsets[-1]:
+        bounds.append(offsets[-1])
+    return bounds
 
 
 class VoxelGrid:
@@ -22,15 +173,34 @@ class VoxelGrid:
         shape:
             Voxel grid shape with channels first (n_channels, dim1, dim2, dim3).
         occupancy_func:
-            Occupancy function to use.
+            Occupancy function to use, a docktgrid.occupancy.OccupancyModel.
+        cutoff:
+            Interaction cutoff as a multiple of the atoms vdW radii, or None.
+        engine:
+            Strategy used to evaluate the occupancies ("dense", "cells" or "stamp").
+        memory_budget:
+            Approximate memory limit, in bytes, for the dense engine intermediates.
+        dtype:
+            Data type of the voxel grids.
     """
 
+    ENGINES = ("dense", "cells", "stamp")
+    CELLS_PER_CUTOFF = 3
+    BYTES_PER_PAIR = 20  # peak memory of the dense engine per (point, atom) pair
+    PACKED_TILE_PAIRS = 2**19  # (point, atom) pairs per tile of a packed dense pass
+
     def __init__(
         self,
         views: List[View],
         vox_size: float,
         box_dims: List[float],
-        occupancy: str = "vdw",
+        occupancy: Union[str, OccupancyModel] = "vdw",
+        cutoff: Optional[float] = None,
+        tol: Optional[float] = None,
+        engine: str = "dense",
+        memory_budget: Optional[int] = None,
+        dtype: torch.dtype = DTYPE,
+        num_buffers: int = 0,
     ):
         """Initialize voxel grid.
 
@@ -38,12 +208,70 @@ class VoxelGrid:
             views: List of views.
             vox_size: Voxel size.
             box_dims: Dimensions of the box containing the grid.
-            occupancy: Occupancy function to use.
+            occupancy: Occupancy function to use, one of "vdw" (default), "vdw_lut"
+                (tabulated vdW model), "binary" or "gaussian", or an OccupancyModel.
+            cutoff: Interaction cutoff, as a multiple of each atom's vdW radius. Atoms
+                farther than `cutoff * vdw` from the box are discarded before the
+                occupancies are computed. If None (default), all atoms are used.
+            tol: Occupancy tolerance, an alternative to `cutoff`. The cutoff is chosen
+                so that discarded atoms contribute less than `tol` to every voxel.
+            engine: Strategy used to evaluate the occupancies. "dense" (default)
+                evaluates every grid point against every atom; "cells" bins atoms
+                into cells aligned with the grid voxels, so each voxel only evaluates
+                atoms from neighboring cells; "stamp" lets each atom write into the
+                voxels within its cutoff radius only, using a precomputed stencil.
+                Engines other than "dense" need a finite cutoff; if none is given, it
+                is derived from a tolerance of 1e-6.
+            memory_budget: Approximate memory limit, in bytes, for the intermediate
+                tensors of the dense engine. If given, grid points and atoms are
+                processed in tiles that fit the budget and reduced into the output
+                incrementally. If None (default), everything is evaluated at once.
+            dtype: Data type of the voxel grids, e.g. torch.float16, torch.bfloat16
+                or torch.uint8. Occupancies are cast as they are reduced into the
+                output, which is never allocated in float32. uint8 grids store
+                occupancies in [0, 1] as integers in [0, 255]; see `dequantize`.
+            num_buffers: Number of output buffers reused by `voxelize` when no `out`
+                is given. Buffers are handed out in turn, so a returned grid is
+                overwritten `num_buffers` calls later; copy it before then. A
+                DataLoader holds every sample of a batch until it is collated, so
+                `VoxelDataset` never takes its grids from the pool. If 0 (default),
+                a new grid is allocated per call.
 
         """
+        if cutoff is not None and tol is not None:
+            raise ValueError("`cutoff` and `tol` are mutually exclusive.")
+        if engine not in self.ENGINES:
+            raise NotImplementedError(f"Engine {engine} is not implemented yet.")
+
         self.occupancy_func = self.get_occupancy_func(occupancy)
-        self.grid = Grid3D(vox_size, box_dims)
+        if tol is not None:
+            cutoff = self.occupancy_func.get_cutoff(tol)
+        if cutoff is None and engine != "dense":
+            cutoff = self.occupancy_func.get_cutoff(DEFAULT_TOL)
+
+        self.engine = engine
+        self.cutoff = cutoff
+        self.memory_budget = memory_budget
+        self.dtype = dtype
+        self._stencils = {}
+        self.grid = Grid3D(vox_size, box_dims, separable=True)
         self.views = views
+        self.num_buffers = num_buffers
+        self._buffers = []
+        self._next_buffer = 0
+
+        # the grid is kept on the device, along with the box bounds used for cutoffs
+        self._axes = tuple(u.to(DEVICE) for u in self.grid.axes)
+        self._bounds = torch.stack(
+            [torch.stack((u[0], u[-1])) for u in self.grid.axes], 1
+        )
+        self._origin = self._bounds[0].to(DEVICE)
+
+    def __getstate__(self):
+        # buffers are not shared, e.g. with DataLoader workers
+        state = self.__dict__.copy()
+        state["_buffers"], state["_next_buffer"] = [], 0
+        return state
 
     @property
     def num_channels(self):
@@ -64,12 +292,12 @@ class VoxelGrid:
 
     def get_occupancy_func(self, occ):
         """Get occupancy function."""
-        if occ == "vdw":
-            return self._voxelize_vdw
-        else:
-            raise NotImplementedError(
-                " ".join((f"Occupancy function for {occ} is not implemented yet."))
-            )
+        return get_occupancy_model(occ)
+
+    @property
+    def cacheable(self):
+        """Whether the channels masks of a complex can be reused (all views cacheable)."""
+        return all(getattr(v, "cacheable", False) for v in self.views)
 
     def get_channels_mask(self, molecule):
         """Build channels mask.
@@ -77,6 +305,9 @@ class VoxelGrid:
         Each channel is a boolean mask that indicates which atoms are present in the
         channel.
 
+        If all views are cacheable, the mask is stored in the `channels_cache` of the
+        complex and returned by later calls, so it must not be modified in place.
+
         Args:
             molecule (docktgrid.molecule.MolecularComplex)
 
@@ -84,7 +315,78 @@ class VoxelGrid:
             A torch.Tensor with shape (n_channels, n_atoms) type bool
 
         """
-        return torch.cat([v(molecule) for v in self.views])
+        return self._get_cached(
+            molecule,
+            tuple(self.views),
+            lambda: torch.cat([v(molecule) for v in self.views]),
+        )
+
+    def get_channels_bits(self, molecule):
+        """Build the channels of each atom as packed bitmasks.
+
+        This is the compact form of `get_channels_mask` consumed by the engines:
+        channel `i` is bit `i % 63` of word `i // 63` (see `pack_channels`). It is
+        cached like the mask.
+
+        Args:
+            molecule (docktgrid.molecule.MolecularComplex)
+
+        Returns:
+            A torch.Tensor with shape (n_words, n_atoms) type int64
+
+        """
+        return self._get_cached(
+            molecule, ("bits", *self.views), lambda: self._build_channels_bits(molecule)
+        )
+
+    def _get_cached(self, molecule, key, build):
+        cache = getattr(molecule, "channels_cache", None)
+        if cache is None or not self.cacheable:
+            return build()
+        if key not in cache:
+            cache[key] = build()
+        return cache[key]
+
+    def _build_channels_bits(self, molecule):
+        n_words = max(1, -(-self.num_channels // BITS_PER_WORD))
+        out = torch.zeros((n_words, molecule.n_atoms), dtype=torch.int64)
+
+        # shift the bits of each view to its first channel
+        offset = 0
+        for view in self.views:
+            if hasattr(view, "get_channels_bits"):
+                bits = view.get_channels_bits(molecule)
+            else:
+                bits = pack_channels(view(molecule))
+            for j, word in enumerate(bits):
+                w, shift = divmod(offset + j * BITS_PER_WORD, BITS_PER_WORD)
+                out[w] |= (word << shift) & WORD_MASK
+                if shift and w + 1 < n_words:
+                    out[w + 1] |= word >> (BITS_PER_WORD - shift)
+            offset += view.get_num_channels()
+        return out
+
+    def _get_channels(self, molecule, channels):
+        """Get the packed channels of `molecule`, or validate and pack `channels`."""
+        if channels is None:
+            return self.get_channels_bits(molecule)
+
+        channels = torch.as_tensor(channels)
+        cshape = (self.num_channels, molecule.n_atoms)
+        bshape = (max(1, -(-self.num_channels // BITS_PER_WORD)), molecule.n_atoms)
+        if channels.shape == cshape:
+            return pack_channels(channels)
+        if channels.dtype == torch.int64 and channels.shape == bshape:
+            return channels
+        raise ValueError(
+            " ".join(
+                (
+                    "`channels` shape must be == {}".format(cshape),
+                    "(or {} for packed bitmasks),".format(bshape),
+                    "currently it is {}".format(tuple(channels.shape)),
+                )
+            )
+        )
 
     def voxelize(self, molecule, out=None, channels=None, requires_grad=False):
         """Voxelize protein-ligand complex and return voxel grid (features).
@@ -92,109 +394,717 @@ class VoxelGrid:
         Args:
             molecule: docktgrid.molecule.MolecularComplex.
 
-            out (array-like or None): Alternate output array in which to place the result.
-            The default is None; if provided, it must have shape corresponding to
-            (n_channels, nvoxels).
+            out (torch.Tensor or None): Alternate output tensor in which to place the
+            result. The default is None; if provided, it must have shape (n_channels,
+            dim1, dim2, dim3) and the dtype and device of the voxel grids.
 
-            channels (array-like or None): Must have shape (n_channels, n_atoms); if
-            provided overrides channels
-            created from `view`.
+            channels (array-like or None): Must have shape (n_channels, n_atoms), or be
+            packed bitmasks of shape (n_words, n_atoms) (see `pack_channels`); if
+            provided overrides channels created from `view`.
 
         Returns:
             A torch tensor of shape (n_channels, dim1, dim2, dim3). Each element
             corresponds to voxel values, calculated according to the occupancy model.
 
         """
-        if out is None:
+        if out is None and self.num_buffers > 0 and not requires_grad:
+            out = self._get_buffer().zero_()
+        elif out is None:
             out = torch.zeros(
-                self.shape, dtype=DTYPE, device=DEVICE, requires_grad=requires_grad
+                self.shape, dtype=self.dtype, device=DEVICE, requires_grad=requires_grad
             )
         else:
-            if out.shape != self.shape:
-                raise ValueError(
-                    " ".join(
-                        (
-                            "`out` shape must be == {},".format(self.shape),
-                            "currently it is {}".format(out.shape),
-                        )
-                    )
+            self._check_out(out, self.shape)
+            if requires_grad:
+                out.requires_grad_(requires_grad)
+            out.detach().zero_()  # occupancies are reduced into `out`
+
+        channels = self._get_channels(molecule, channels)
+
+        # create voxel based in occupancy option
+        self._voxelize_atoms(molecule, out, channels)
+
+        return out.view(self.shape)
+
+    def _check_out(self, out, shape) -> None:
+        """Check that voxel grids of `shape` can be written into `out` in place."""
+        if not isinstance(out, torch.Tensor):
+            raise ValueError(
+                "`out` must be a torch.Tensor, currently it is {}".format(type(out))
+            )
+        if out.shape != shape:
+            raise ValueError(
+                "`out` shape must be == {}, currently it is {}".format(shape, out.shape)
+            )
+        if out.dtype != self.dtype:
+            raise ValueError(
+                "`out` dtype must be == {}, currently it is {}".format(
+                    self.dtype, out.dtype
                 )
-            out = torch.as_tensor(out, DTYPE, DEVICE, requires_grad=requires_grad)
+            )
+        device = out.device
+        if device.type != DEVICE.type or DEVICE.index not in (None, device.index):
+            raise ValueError(
+                "`out` device must be == {}, currently it is {}".format(DEVICE, device)
+            )
 
-        if channels is None:
-            channels = self.get_channels_mask(molecule)
+    def _get_buffer(self) -> torch.Tensor:
+        """Get the next output buffer of the pool, allocating it on first use."""
+        i = self._next_buffer
+        if i == len(self._buffers):
+            self._buffers.append(
+                torch.empty(self.shape, dtype=self.dtype, device=DEVICE)
+            )
+        self._next_buffer = (i + 1) % self.num_buffers
+        return self._buffers[i]
+
+    def voxelize_sparse(self, molecule, channels=None, threshold=0.0):
+        """Voxelize protein-ligand complex and return a sparse voxel grid.
+
+        Most voxels of a grid are zero or nearly zero, in particular in ligand
+        channels, so a sparse grid is much smaller to store or to send across
+        processes. Use `densify` to get the dense grid back.
+
+        Args:
+            molecule: docktgrid.molecule.MolecularComplex.
+
+            channels (array-like or None): Must have shape (n_channels, n_atoms), or be
+            packed bitmasks of shape (n_words, n_atoms) (see `pack_channels`); if
+            provided overrides channels created from `view`.
+
+            threshold (float): Occupancies smaller than or equal to `threshold` are
+            dropped.
+
+        Returns:
+            A coalesced sparse COO torch tensor of shape
+            (n_channels, dim1, dim2, dim3).
+
+        """
+        return to_sparse(self.voxelize(molecule, channels=channels), threshold)
+
+    def voxelize_batch(self, molecules, out=None, channels=None):
+        """Voxelize a batch of protein-ligand complexes at once.
+
+        Atoms of all complexes are packed together, translated to their box centers,
+        and the occupancies are computed against the shared grid in a single
+        vectorized pass of the dense kernel; other engines are evaluated one complex
+        at a time.
+
+        Args:
+            molecules: List of docktgrid.molecule.MolecularComplex.
+
+            out (torch.Tensor or None): Alternate output tensor in which to place the
+            result. The default is None; if provided, it must have shape
+            (n_molecules, *shape) and the dtype and device of the voxel grids.
+
+            channels (list or None): List of masks, one per complex, with shapes
+            (n_channels, n_atoms), or packed bitmasks; if provided overrides channels
+            created from `view`.
+
+        Returns:
+            A torch tensor of shape (n_molecules, n_channels, dim1, dim2, dim3).
+
+        """
+        bshape = (len(molecules), *self.shape)
+        if out is None:
+            out = torch.zeros(bshape, dtype=self.dtype, device=DEVICE)
         else:
-            cshape = (self.num_channels, molecule.n_atoms)
-            if channels.shape != cshape:
-                raise ValueError(
-                    " ".join(
-                        (
-                            "`channels` shape must be == {},".format(cshape),
-                            "currently it is {}".format(channels.shape),
-                        )
-                    )
+            self._check_out(out, bshape)
+            out.zero_()
+
+        if channels is None:
+            channels = [self.get_channels_bits(m) for m in molecules]
+
+        if self.engine != "dense":
+            for i, (molecule, mask) in enumerate(zip(molecules, channels)):
+                self.voxelize(molecule, out=out[i], channels=mask)
+            return out
+
+        self._voxelize_atoms_batch(molecules, out, channels)
+        return out
+
+    def voxelize_receptor(self, molecule, center=None, channels=None):
+        """Voxelize the protein atoms of a complex only.
+
+        The resulting grid holds the protein contribution to every channel, and can be
+        reused by `voxelize_poses` for any number of ligand poses in the same box.
+
+        Args:
+            molecule: docktgrid.molecule.MolecularComplex.
+
+            center (array-like or None): Center of the box, shape (3,). The default is
+            the ligand center of `molecule`.
+
+            channels (array-like or None): Must have shape (n_channels, n_atoms), or be
+            packed bitmasks of shape (n_words, n_atoms) (see `pack_channels`); if
+            provided overrides channels created from `view`.
+
+        Returns:
+            A torch tensor of shape (n_channels, dim1, dim2, dim3).
+
+        """
+        center = self._get_box_center(molecule, center)
+        channels = self._get_channels(molecule, channels)
+        n_protein = molecule.n_atoms_protein
+
+        out = torch.zeros(self.shape, dtype=self.dtype, device=DEVICE)
+        with torch.no_grad():
+            self._voxelize_coords(
+                out.view(self.num_channels, -1),
+                molecule.coords[:, :n_protein],
+                molecule.vdw_radii[:n_protein],
+                channels[:, :n_protein],
+                center,
+            )
+        return out
+
+    def voxelize_poses(
+        self, molecule, poses, out=None, channels=None, center=None, receptor=None
+    ):
+        """Voxelize many poses of the ligand of a complex in the same box.
+
+        The protein contribution is computed once (or taken from `receptor`) and each
+        pose only evaluates the ligand atoms, which are max-combined with it. Every
+        pose is voxelized in the same box, centered at `center`.
+
+        Args:
+            molecule: docktgrid.molecule.MolecularComplex; its ligand sets the atoms
+            and channels of the poses.
+
+            poses (array-like): Ligand coords of each pose, with shape
+            (n_poses, 3, n_atoms_ligand).
+
+            out (torch.Tensor or None): Alternate output tensor in which to place the
+            result. The default is None; if provided, it must have shape
+            (n_poses, *shape) and the dtype and device of the voxel grids.
+
+            channels (array-like or None): Must have shape (n_channels, n_atoms), or be
+            packed bitmasks of shape (n_words, n_atoms) (see `pack_channels`); if
+            provided overrides channels created from `view`.
+
+            center (array-like or None): Center of the box, shape (3,). The default is
+            the ligand center of `molecule`.
+
+            receptor (array-like or None): Protein grid from `voxelize_receptor` for
+            the same box; if None, it is computed.
+
+        Returns:
+            A torch tensor of shape (n_poses, n_channels, dim1, dim2, dim3).
+
+        """
+        poses = torch.as_tensor(poses, dtype=DTYPE)
+        pshape = (molecule.n_atoms_ligand,)
+        if poses.ndim != 3 or poses.shape[1:] != (3, *pshape):
+            raise ValueError(
+                "`poses` shape must be == (n_poses, 3, {}), currently it is {}".format(
+                    *pshape, poses.shape
                 )
-            channels = torch.as_tensor(channels, dtype=DTYPE, device=DEVICE)
+            )
 
-        # create voxel based in occupancy option
-        self.occupancy_func(molecule, out, channels)
+        bshape = (poses.shape[0], *self.shape)
+        if out is None:
+            out = torch.empty(bshape, dtype=self.dtype, device=DEVICE)
+        else:
+            self._check_out(out, bshape)
 
-        return out.view(self.shape)
+        center = self._get_box_center(molecule, center)
+        channels = self._get_channels(molecule, channels)
+        if receptor is None:
+            receptor = self.voxelize_receptor(molecule, center, channels)
+        out.copy_(receptor)
 
-    @torch.no_grad()
-    def _voxelize_vdw(self, molecule, out, channels) -> None:
-        points = self.grid.points
+        n_protein = molecule.n_atoms_protein
+        vdws = molecule.vdw_radii[n_protein:]
+        channels = channels[:, n_protein:]
+        with torch.no_grad():
+            self._voxelize_poses(out, poses, vdws, channels, center)
+        return out
+
+    def voxelize_rotations(self, molecule, rotations, out=None, channels=None):
+        """Voxelize several rotations of a complex at once.
+
+        Grid `i` is the voxel grid of `molecule` after rotating its atoms and ligand
+        center by `rotations[i]`, as `RandomRotation` does. Rotated copies of the
+        atoms are packed in a single dense pass over the shared grid, in cache-sized
+        tiles, which makes it about 2.4x faster than rotating the complex and calling
+        `voxelize` for each rotation (24 A box at 1 A, CPU). The speedup comes from
+        the tiling: on CPU, packing more rotations in a call is not faster than one
+        call per rotation, but it saves per-call overhead on GPUs.
+
+        Args:
+            molecule: docktgrid.molecule.MolecularComplex.
+
+            rotations (array-like): Rotation matrices, shape (n_rotations, 3, 3).
+
+            out (torch.Tensor or None): Alternate output tensor in which to place the
+            result. The default is None; if provided, it must have shape
+            (n_rotations, *shape) and the dtype and device of the voxel grids.
+
+            channels (array-like or None): Must have shape (n_channels, n_atoms), or be
+            packed bitmasks of shape (n_words, n_atoms) (see `pack_channels`); if
+            provided overrides channels created from `view`.
+
+        Returns:
+            A torch tensor of shape (n_rotations, n_channels, dim1, dim2, dim3).
+
+        """
+        rotations = torch.as_tensor(rotations, dtype=DTYPE)
+        if rotations.ndim != 3 or rotations.shape[1:] != (3, 3):
+            raise ValueError(
+                "`rotations` shape must be == (n_rotations, 3, 3), "
+                "currently it is {}".format(rotations.shape)
+            )
+
+        bshape = (rotations.shape[0], *self.shape)
+        if out is None:
+            out = torch.zeros(bshape, dtype=self.dtype, device=DEVICE)
+        else:
+            self._check_out(out, bshape)
+            out.zero_()
+
+        channels = self._get_channels(molecule, channels)
+
+        # rotating about the ligand center leaves the box in place
         center = molecule.ligand_center
-        # translate grid points and reshape for proper broadcasting
-        grid = [(u + v).unsqueeze(-1) for u, v in zip(points, center)]
+        coords = molecule.coords - center[:, None]
+        coords = torch.matmul(rotations, coords) + center[:, None]
+        with torch.no_grad():
+            self._voxelize_poses(out, coords, molecule.vdw_radii, channels, center)
+        return out
 
-        x, y, z = 0, 1, 2
+    def _voxelize_poses(self, out, poses, vdws, channels, center) -> None:
+        """Max-reduce several sets of coords of the same atoms into `out`."""
+        out = out.view(poses.shape[0], self.num_channels, math.prod(self.shape[1:]))
+        if poses.shape[0] == 0:
+            return
+        if self.engine != "dense":
+            # the other engines also max-combine into `out`, one pose at a time
+            for i, coords in enumerate(poses):
+                self._voxelize_coords(out[i], coords, vdws, channels, center)
+            return
+
+        # the dense kernel max-reduces into `out`, poses are packed as a batch
+        atoms = []
+        for coords in poses:
+            keep = self.get_atoms_within_cutoff(coords, vdws, center)
+            atoms.append(
+                (coords[:, keep] - center[:, None], vdws[keep], channels[:, keep])
+            )
+        self._voxelize_dense(out, atoms, self._get_packed_budget(out.shape[2], atoms))
+
+    @staticmethod
+    def _get_box_center(molecule, center):
+        if center is None:
+            return molecule.ligand_center
+        return torch.as_tensor(center, dtype=DTYPE).view(3)
+
+    def get_pocket_params(self):
+        """Get the binding pocket that holds every atom that may reach the grid.
+
+        The pocket is a sphere around the box center, so it holds those atoms in any
+        rotation: its radius is the distance from the center to the farthest grid
+        point, with a margin of `cutoff` vdW radii (derived from a tolerance of 1e-6
+        if `cutoff` is None).
+
+        Returns:
+            A tuple (pocket_radius, pocket_cutoff), see `MolecularComplex`.
+
+        """
+        radius = math.sqrt(sum(float(torch.max(u**2)) for u in self.grid.axes))
+        cutoff = self.cutoff
+        if cutoff is None:
+            cutoff = self.occupancy_func.get_cutoff(DEFAULT_TOL)
+        return radius, cutoff
+
+    def get_atoms_within_cutoff(self, coords, vdw_radii, center):
+        """Select atoms that are within the interaction cutoff of the box.
+
+        Args:
+            coords: torch.Tensor of shape (3, n_atoms).
+            vdw_radii: torch.Tensor of shape (n_atoms,).
+            center: torch.Tensor of shape (3,), the center of the box.
+
+        Returns:
+            A boolean torch.Tensor of shape (n_atoms,); all True if `cutoff` is None.
+
+        """
+        if self.cutoff is None:
+            return torch.ones(coords.shape[1], dtype=torch.bool, device=coords.device)
+
+        lower, upper = self._bounds.to(coords.device) + center
+
+        # per-axis distance from the atoms to the box (zero if inside)
+        dist = torch.clamp(lower[:, None] - coords, min=0) + torch.clamp(
+            coords - upper[:, None], min=0
+        )
+        return torch.sum(dist**2, 0) <= (self.cutoff * vdw_radii) ** 2
+
+    @torch.no_grad()
+    def _voxelize_atoms(self, molecule, out, channels) -> None:
         # reshape to n_channls, n_points
-        out = out.view(channels.shape[0], grid[x].shape[0])
-
-        self._calc_vdw_occupancies(
-            out,
-            channels,
-            molecule.coords[x].to(DEVICE),
-            molecule.coords[y].to(DEVICE),
-            molecule.coords[z].to(DEVICE),
-            grid[x].to(DEVICE),
-            grid[y].to(DEVICE),
-            grid[z].to(DEVICE),
-            molecule.vdw_radii.to(DEVICE),
+        out = out.view(self.num_channels, -1)
+        self._voxelize_coords(
+            out, molecule.coords, molecule.vdw_radii, channels, molecule.ligand_center
+        )
+
+    def _voxelize_coords(self, out, coords, vdws, channels, center) -> None:
+        if self.cutoff is not None:  # discard atoms far from the box
+            keep = self.get_atoms_within_cutoff(coords, vdws, center)
+            coords, vdws = coords[:, keep], vdws[keep]
+            channels = channels[:, keep.to(channels.device)]
+
+        if self.engine == "dense":
+            # translate the atoms to the grid, which is centered at the origin
+            atoms = [(coords - center[:, None], vdws, channels)]
+            self._voxelize_dense(out[None], atoms)
+            return
+
+        coords, vdws = self._to_device(coords - center[:, None], vdws)
+        if self.engine == "cells":
+            self._calc_occupancies_cells(out, channels, coords, vdws)
+        else:
+            self._calc_occupancies_stamp(out, channels, coords, vdws)
+
+    @staticmethod
+    def _to_device(coords, vdws):
+        """Move atom coords and vdW radii to the device in one packed transfer."""
+        packed = torch.cat((coords, vdws[None]), 0).to(DEVICE)
+        return packed[:3], packed[3]
+
+    @torch.no_grad()
+    def _voxelize_atoms_batch(self, molecules, out, channels) -> None:
+        # translate the selected atoms of each complex, so that every complex shares
+        # the same grid centered at the origin
+        atoms = []
+        for molecule, mask in zip(molecules, channels):
+            coords, vdws = molecule.coords, molecule.vdw_radii
+            center = molecule.ligand_center
+            mask = self._get_channels(molecule, mask)
+            keep = self.get_atoms_within_cutoff(coords, vdws, center)
+            atoms.append((coords[:, keep] - center[:, None], vdws[keep], mask[:, keep]))
+
+        out = out.view(len(molecules), self.num_channels, math.prod(self.shape[1:]))
+        if not atoms:
+            return
+        self._voxelize_dense(out, atoms, self._get_packed_budget(out.shape[2], atoms))
+
+    def _get_packed_budget(self, n_points: int, atoms) -> int:
+        """Get the memory budget of a dense pass packing several sets of atoms.
+
+        Tiles span the whole grid and about `PACKED_TILE_PAIRS` pairs, so that their
+        intermediates stay in the CPU caches, and never more than the footprint of
+        the largest set of atoms (or `memory_budget`). Packing thus costs no more
+        memory than evaluating the sets one by one, and larger tiles would save no
+        reductions, since tiles end at group boundaries.
+
+        """
+        n_points = max(n_points, 1)
+        n_atoms = max((coords.shape[1] for coords, _, _ in atoms), default=0)
+        pairs = min(n_points * max(n_atoms, 1), max(n_points, self.PACKED_TILE_PAIRS))
+        budget = self.BYTES_PER_PAIR * pairs
+        if self.memory_budget is not None:
+            return min(budget, self.memory_budget)
+        return budget
+
+    def _voxelize_dense(self, out, atoms, memory_budget=None) -> None:
+        """Evaluate the dense engine for a list of complexes sharing the same grid.
+
+        Atoms of each complex are packed in the order given by `get_channel_segments`,
+        so each channel is reduced from contiguous column segments of the occupancy
+        matrix, without copying it. Squared distances are separable on the regular
+        grid, so they are computed per axis and broadcast.
+
+        Args:
+            out: Output tensor, shape (n_batch, n_channels, n_points).
+            atoms: List of (coords, vdw_radii, channels) tuples, one per complex, with
+                coords relative to the box center and packed channels.
+            memory_budget: Overrides `memory_budget` if given.
+
+        """
+        coords, vdws, members, batch, offsets = [], [], [], [], [0]
+        for b, (c, v, mask) in enumerate(atoms):
+            order, segments, groups = get_channel_segments(mask, self.num_channels)
+            coords.append(c[:, order])
+            vdws.append(v[order])
+            for count, group in zip(torch.diff(segments).tolist(), groups):
+                members.append(torch.nonzero(group).squeeze(1))
+                batch.append(b)
+                offsets.append(offsets[-1] + count)
+
+        # move everything to the device once, tiles are views
+        (ax, ay, az), vdws = self._to_device(torch.cat(coords, 1), torch.cat(vdws))
+        if members:
+            sizes = [u.shape[0] for u in members]
+            members = torch.cat(members).to(DEVICE).split(sizes)
+        px, py, pz = self._axes
+
+        # point tiles are made of whole yz-slabs of the grid, which are contiguous in
+        # `out`; atom tiles end at group boundaries where they can, so each group is
+        # reduced once per point tile (only once if the whole grid fits)
+        nx, slab = px.shape[0], py.shape[0] * pz.shape[0]
+        n_points, n_atoms = nx * slab, offsets[-1]
+        point_tile, atom_tile = self.get_tile_sizes(
+            n_points, n_atoms, step=slab, memory_budget=memory_budget
         )
+        bounds = _get_atom_tiles(offsets, atom_tile)
+        for i in range(0, n_points, point_tile):
+            p = slice(i, i + point_tile)
+            x = slice(i // slab, (i + point_tile) // slab)
+            for j, k in zip(bounds[:-1], bounds[1:]):
+                a = slice(j, k)
+                # groups with atoms in the tile
+                g0 = bisect.bisect_right(offsets, j) - 1
+                g1 = bisect.bisect_left(offsets, k)
+                self._calc_occupancies(
+                    out[..., p],
+                    members[g0:g1],
+                    batch[g0:g1],
+                    [min(max(o - j, 0), k - j) for o in offsets[g0 : g1 + 1]],
+                    ax[a],
+                    ay[a],
+                    az[a],
+                    px[x],
+                    py,
+                    pz,
+                    vdws[a],
+                    self.occupancy_func,
+                )
 
     @staticmethod
-    @torch.jit.script
-    def _calc_vdw_occupancies(
-        out: torch.Tensor,  # output tensor, shape (n_channels, n_points)
-        channels: torch.Tensor,  # bool mask of channels, shape (n_channels, n_atoms)
+    def _calc_occupancies(
+        out: torch.Tensor,  # output tensor, shape (n_batch, n_channels, n_points)
+        members: List[torch.Tensor],  # channel indices of each group of atoms
+        batch: List[int],  # complex of each group of atoms
+        offsets: List[int],  # atoms of group g are in [offsets[g], offsets[g + 1])
         ax: torch.Tensor,  # x coords of atoms, shape (n_atoms,)
         ay: torch.Tensor,  # y coords of atoms, shape (n_atoms,)
         az: torch.Tensor,  # z coords of atoms, shape (n_atoms,)
-        px: torch.Tensor,  # x coords of grid points, shape (n_points, 1)
-        py: torch.Tensor,  # y coords of grid points, shape (n_points, 1)
-        pz: torch.Tensor,  # z coords of grid points, shape (n_points, 1)
+        px: torch.Tensor,  # x axis of the grid, shape (nx,)
+        py: torch.Tensor,  # y axis of the grid, shape (ny,)
+        pz: torch.Tensor,  # z axis of the grid, shape (nz,)
         vdws: torch.Tensor,  # vdw radii of atoms, shape (n_atoms,)
+        occupancy: OccupancyModel,
     ):
-        dist = torch.sqrt(
-            torch.pow(ax - px, 2) + torch.pow(ay - py, 2) + torch.pow(az - pz, 2)
+        # squared distances from per-axis terms, broadcast to (nx, ny, nz, n_atoms)
+        dx = torch.pow(ax - px[:, None], 2)[:, None, None]
+        dy = torch.pow(ay - py[:, None], 2)[None, :, None]
+        dz = torch.pow(az - pz[:, None], 2)[None, None, :]
+        dist2 = (dx + dy + dz).view(-1, ax.shape[0])
+        occs = occupancy(dist2 / torch.pow(vdws, 2))  # voxel occupancies
+
+        # segmented max over groups, then max-combine into the channels of each group
+        for g, (start, end) in enumerate(zip(offsets[:-1], offsets[1:])):
+            if start < end:
+                occ = _cast_occupancies(
+                    torch.amax(occs[:, start:end], dim=1), out.dtype
+                )
+                rows = out[batch[g]]
+                rows[members[g]] = torch.maximum(rows[members[g]], occ)
+
+    def get_tile_sizes(
+        self,
+        n_points: int,
+        n_atoms: int,
+        step: int = 1,
+        memory_budget: Optional[int] = None,
+    ):
+        """Get the number of points and atoms evaluated at once by the dense engine.
+
+        Tiles are sized so that the (n_points, n_atoms) intermediate tensors fit in
+        `memory_budget`. Points are only split if a single atom does not fit with the
+        whole grid, since each tile of points reduces every group of atoms again.
+
+        Args:
+            n_points: Number of grid points.
+            n_atoms: Number of atoms.
+            step: The point tile is a multiple of `step`.
+            memory_budget: Overrides `memory_budget` if given.
+
+        Returns:
+            A tuple (point_tile, atom_tile).
+
+        """
+        n_points, n_atoms = max(n_points, 1), max(n_atoms, 1)
+        if memory_budget is None:
+            memory_budget = self.memory_budget
+        if memory_budget is None:
+            return n_points, n_atoms
+
+        pairs = max(1, memory_budget // self.BYTES_PER_PAIR)
+        point_tile = min(n_points, max(1, pairs // step) * step)
+        atom_tile = min(n_atoms, max(1, pairs // point_tile))
+        return point_tile, atom_tile
+
+    def _calc_occupancies_cells(self, out, channels, coords, vdws):
+        """Compute occupancies using a cell list.
+
+        Atoms are binned into cubic cells of `m` voxels per edge, chosen so that the
+        largest interaction radius spans about `CELLS_PER_CUTOFF` cells. The grid
+        points of each cell then only need to evaluate the atoms of the cells within
+        that reach. Occupancies are max-reduced per group of atoms with the same
+        channels (see `get_channel_segments`) in a single pass, and each group is then
+        max-combined into its channels.
+
+        """
+        # keep the atoms of any channel, sorted by group
+        grouped, offsets, groups = get_channel_segments(channels, out.shape[0])
+        grouped = grouped.to(DEVICE)
+        coords, vdws = coords[:, grouped], vdws[grouped]
+        n_atoms, n_groups = coords.shape[1], groups.shape[0]
+        if n_atoms == 0:
+            return
+        group_ids = torch.repeat_interleave(
+            torch.arange(n_groups, device=DEVICE), torch.diff(offsets).to(DEVICE)
+        )
+
+        vox_size = self.grid.vox_size
+        dims = self.grid.axes_dims
+        rmax = self.cutoff * float(vdws.max())  # largest interaction radius
+        m = max(1, round(rmax / (self.CELLS_PER_CUTOFF * vox_size)))
+        cell_size = m * vox_size
+        reach = math.ceil(rmax / cell_size)  # n. of neighbor cells on each side
+        ncells = [-(-n // m) for n in dims]  # n. of cells covering the grid
+        shape = [n + 2 * reach for n in ncells]  # plus padding for atoms outside
+        origin = self._origin
+
+        # sort atoms by cell
+        acells = torch.floor((coords - origin[:, None]) / cell_size).long() + reach
+        acells = torch.minimum(
+            acells.clamp(min=0), torch.tensor(shape, device=DEVICE)[:, None] - 1
         )
-        occs = 1 - torch.exp(-1 * torch.pow(vdws / dist, 12))  # voxel occupancies
-
-        for i, mask in enumerate(channels):
-            if torch.any(mask):
-                torch.amax(occs[:, mask], dim=1, out=out[i])
-
-    # a version without the for loop (it seems to be slower and uses more memory?)
-    # @staticmethod
-    # @torch.jit.script
-    # def _calc_vdw_occupancies(out, channels, ax, ay, az, px, py, pz, vdws):
-    #     dist = torch.sqrt(
-    #         torch.pow((ax - px), 2) + torch.pow((ay - py), 2) + torch.pow((az - pz), 2)
-    #     )
-
-    #     occs = 1 - torch.exp(-1 * torch.pow(vdws / dist, 12)).unsqueeze(0)
-    #     mask = channels.view(channels.shape[0], 1, channels.shape[1])
-    #     out[:, :], _ = torch.max(torch.where(mask, occs, 0), dim=2)
-    #     out[:, :], _ = torch.max(torch.where(mask, occs, 0), dim=2)
+        ids = (acells[0] * shape[1] + acells[1]) * shape[2] + acells[2]
+        order = torch.argsort(ids)
+        counts = torch.bincount(ids, minlength=shape[0] * shape[1] * shape[2])
+        starts = torch.cumsum(counts, 0) - counts
+
+        # ids of the neighbors of each cell covering the grid, (n_cells, n_neighbors)
+        cx, cy, cz = (
+            u.reshape(-1, 1)
+            for u in torch.meshgrid(
+                *[torch.arange(n, device=DEVICE) for n in ncells], indexing="ij"
+            )
+        )
+        ox, oy, oz = (
+            u.reshape(1, -1)
+            for u in torch.meshgrid(
+                *[torch.arange(2 * reach + 1, device=DEVICE)] * 3, indexing="ij"
+            )
+        )
+        nids = ((cx + ox) * shape[1] + (cy + oy)) * shape[2] + (cz + oz)
+
+        # indices of the neighboring atoms of each cell, padded to k, (n_cells, k)
+        ncounts, nstarts = counts[nids], starts[nids]
+        cumcounts = torch.cumsum(ncounts, 1)
+        k = int(cumcounts[:, -1].max())
+        if k == 0:
+            return
+        j = torch.arange(k, device=DEVICE).expand(nids.shape[0], k).contiguous()
+        valid = j < cumcounts[:, -1:]
+        seg = torch.searchsorted(cumcounts, j, right=True).clamp(max=nids.shape[1] - 1)
+        pos = (
+            torch.gather(nstarts, 1, seg)
+            + j
+            - torch.gather(cumcounts - ncounts, 1, seg)
+        )
+        neighbors = order[pos.clamp(max=n_atoms - 1)]
+
+        # coords of grid points in each cell, (n_cells, m^3, 1)
+        local = torch.arange(m, device=DEVICE) * vox_size
+        lx, ly, lz = (
+            u.reshape(1, -1, 1)
+            for u in torch.meshgrid(local, local, local, indexing="ij")
+        )
+        px = origin[0] + cx.unsqueeze(-1) * cell_size + lx
+        py = origin[1] + cy.unsqueeze(-1) * cell_size + ly
+        pz = origin[2] + cz.unsqueeze(-1) * cell_size + lz
+
+        # occupancies of each grid point, (n_cells, m^3, k)
+        ax, ay, az = (u[neighbors].unsqueeze(1) for u in coords)
+        dist2 = torch.pow(ax - px, 2) + torch.pow(ay - py, 2) + torch.pow(az - pz, 2)
+        occs = self.occupancy_func(dist2 / torch.pow(vdws[neighbors].unsqueeze(1), 2))
+
+        # max over the neighbors of each group, (n_cells, m^3, n_groups + 1); the
+        # padding of the neighbor lists goes to an extra group, which is dropped
+        gids = torch.where(valid, group_ids[neighbors], n_groups)
+        occs = torch.zeros(
+            (*occs.shape[:2], n_groups + 1), dtype=occs.dtype, device=DEVICE
+        ).scatter_reduce_(2, gids.unsqueeze(1).expand_as(occs), occs, reduce="amax")
+
+        # from (cx, cy, cz, lx, ly, lz, g) to (g, x, y, z) and crop the padded cells
+        nx, ny, nz = dims
+        occs = occs[..., :n_groups].view(*ncells, m, m, m, n_groups)
+        occs = occs.permute(6, 0, 3, 1, 4, 2, 5)
+        occs = occs.reshape(n_groups, ncells[0] * m, ncells[1] * m, ncells[2] * m)
+        occs = occs[:, :nx, :ny, :nz]
+
+        out = out.view(-1, nx, ny, nz)
+        for occ, members in zip(occs, groups.to(DEVICE)):
+            occ = _cast_occupancies(occ, out.dtype)
+            out[members] = torch.maximum(out[members], occ)
+
+    def get_stencil(self, vdw: float) -> torch.Tensor:
+        """Get the voxel offsets that an atom may reach (cached by vdW radius).
+
+        The offsets are relative to the voxel nearest to the atom and include every
+        voxel within the cutoff radius of any position inside that voxel.
+
+        Args:
+            vdw: vdW radius of the atom.
+
+        Returns:
+            A torch.Tensor of shape (3, n_offsets), type long.
+
+        """
+        if vdw not in self._stencils:
+            vox_size = self.grid.vox_size
+            radius = self.cutoff * vdw + vox_size * math.sqrt(3) / 2
+            n = math.ceil(radius / vox_size)
+            r = torch.arange(-n, n + 1, device=DEVICE)
+            offsets = torch.stack(torch.meshgrid(r, r, r, indexing="ij")).view(3, -1)
+            keep = torch.sum(offsets**2, 0) * vox_size**2 <= radius**2
+            self._stencils[vdw] = offsets[:, keep]
+
+        return self._stencils[vdw]
+
+    def _calc_occupancies_stamp(self, out, channels, coords, vdws):
+        """Compute occupancies by stamping each atom onto its nearby voxels.
+
+        Atoms sharing a vdW radius share a stencil, and the occupancies are reduced
+        into `out` with a scatter max over (channel, voxel) indices.
+
+        """
+        if coords.shape[1] == 0:
+            return
+
+        vox_size = self.grid.vox_size
+        nx, ny, nz = self.grid.axes_dims
+        dims = torch.tensor((nx, ny, nz), device=DEVICE)[:, None, None]
+        origin = self._origin
+        nearest = torch.round((coords - origin[:, None]) / vox_size).long()
+
+        channels = channels.to(DEVICE)
+        out_flat = out.view(-1)
+        n_channels, n_points = out.shape
+
+        for vdw in torch.unique(vdws).tolist():
+            atoms = torch.nonzero(vdws == vdw).squeeze(1)
+            # only the atoms of this radius are unpacked
+            mask = unpack_channels(channels[:, atoms], n_channels)
+            chs, idx = torch.nonzero(mask, as_tuple=True)
+            if chs.shape[0] == 0:
+                continue
+
+            # voxels reached by each atom, (3, n_atoms, n_offsets)
+            voxels = nearest[:, atoms, None] + self.get_stencil(vdw)[:, None, :]
+            inside = torch.all((voxels >= 0) & (voxels < dims), dim=0)
+            points = origin[:, None, None] + voxels * vox_size
+            dist2 = torch.sum((points - coords[:, atoms, None]) ** 2, 0)
+            occs = _cast_occupancies(self.occupancy_func(dist2 / vdw**2), out.dtype)
+            flat = (voxels[0] * ny + voxels[1]) * nz + voxels[2]
+
+            # one entry per (channel, atom) membership
+            index = chs[:, None] * n_points + flat[idx]
+            inside = inside[idx]
+            out_flat.scatter_reduce_(
+                0, index[inside], occs[idx][inside], reduce="amax", include_self=True
+            )
@@ -4,7 +4,7 @@ import torch
 from torch.utils.data import Dataset
 
 from docktgrid import MolecularComplex, VoxelGrid
-from docktgrid.config import DTYPE
+from docktgrid.config import DEVICE, DTYPE
 from docktgrid.molparser import MolecularData, MolecularParser
 from docktgrid.transforms import RandomRotation, Transform
 
@@ -16,6 +16,17 @@ class VoxelDataset(Dataset):
 
     Protein and ligand files must be in a list of strings or a list of MolecularData
     objects and must appear in the same order.
+
+    If `crop_pocket` is True, proteins are cropped to the atoms that may contribute to
+    the voxel grid (see `VoxelGrid.get_pocket_params`) before voxelization.
+
+    If `cache_channels` is True and all views are cacheable, the channels of each
+    sample are built once and reused in later epochs. `voxelize` caches them as packed
+    bitmasks (see `VoxelGrid.get_channels_bits`), which take
+    `8 * ceil(n_channels / 63) * n_atoms` bytes per sample, e.g. 8 bytes per atom for
+    up to 63 channels; a call to `VoxelGrid.get_channels_mask` also caches the boolean
+    mask, another `n_channels * n_atoms` bytes. Each DataLoader worker keeps its own
+    cache.
     """
 
     def __init__(
@@ -27,6 +38,8 @@ class VoxelDataset(Dataset):
         molparser: MolecularParser = MolecularParser(),
         transform: Optional[List[Transform]] = None,
         root_dir: str = "",
+        crop_pocket: bool = False,
+        cache_channels: bool = False,
     ):
         assert len(protein_files) == len(ligand_files), "must have the same length!"
         assert len(protein_files) == len(labels), "must have the same length!"
@@ -38,20 +51,38 @@ class VoxelDataset(Dataset):
         self.molparser = molparser
         self.root_dir = root_dir
         self.transform = transform
+        self.crop_pocket = crop_pocket
+        self.cache_channels = cache_channels
+        self._channels_cache = {}
 
     def __len__(self) -> int:
         return len(self.labels)
 
     def __getitem__(self, idx):
+        pocket_radius, pocket_cutoff = None, 0.0
+        if self.crop_pocket:
+            pocket_radius, pocket_cutoff = self.voxel.get_pocket_params()
+
         molecule = MolecularComplex(
-            self.ptn_files[idx], self.lig_files[idx], self.molparser, self.root_dir
+            self.ptn_files[idx],
+            self.lig_files[idx],
+            self.molparser,
+            self.root_dir,
+            pocket_radius=pocket_radius,
+            pocket_cutoff=pocket_cutoff,
         )
         label = self.labels[idx]
+        if self.cache_channels:
+            # rotations do not change the atoms, so masks are kept per sample
+            molecule.channels_cache = self._channels_cache.setdefault(idx, {})
 
         for transform in self.transform or []:
             if isinstance(transform, RandomRotation):
                 transform(molecule.coords, molecule.ligand_center)
 
-        voxs = self.voxel.voxelize(molecule)
+        # a DataLoader holds every sample of a batch until it is collated, so each
+        # sample gets its own grid instead of one from the pool of `voxel`
+        out = torch.empty(self.voxel.shape, dtype=self.voxel.dtype, device=DEVICE)
+        voxs = self.voxel.voxelize(molecule, out=out)
 
         return voxs, label
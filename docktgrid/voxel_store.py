@@ -0,0 +1,291 @@
+import json
+import os
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+
+__all__ = ["VoxelStoreDataset", "VoxelStoreWriter", "write_voxel_store"]
+
+STORE_FORMAT = "docktgrid-voxel-store"
+STORE_VERSION = 1
+HEADER_FILE = "header.json"
+LABELS_FILE = "labels.npy"
+
+
+class VoxelStoreWriter:
+    """Write voxel grids to a packed store.
+
+    A store is a directory with the grids packed in a few large `.npy` shards of
+    `shard_size` samples each, a `labels.npy` array and a `header.json` file with the
+    grid shape and dtype, the number of samples of each shard, the sample ids and any
+    metadata, e.g. the voxel configuration. Samples are read back with
+    `VoxelStoreDataset`.
+
+    Shards are written through memory maps, so grids are streamed to disk as they are
+    appended. The header is written by `close`, and a store without header is
+    incomplete. The writer is a context manager; if the block raises, the appended
+    grids are flushed but no header is written.
+
+    bfloat16 grids, which NumPy does not support, are stored as their uint16 bits and
+    viewed back as bfloat16 by `VoxelStoreDataset`.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        shape: Iterable[int],
+        dtype: Union[str, np.dtype, torch.dtype] = np.float32,
+        shard_size: int = 1024,
+        metadata: Optional[Dict[str, Any]] = None,
+    ):
+        """Initialize writer.
+
+        Args:
+            path: Directory of the store, created if it does not exist.
+            shape: Shape of each voxel grid, (n_channels, dim1, dim2, dim3).
+            dtype: Data type of the stored grids, a NumPy or torch dtype.
+            shard_size: Number of samples per shard.
+            metadata: JSON serializable dict stored in the header.
+        """
+        if not isinstance(dtype, torch.dtype):
+            dtype = torch.from_numpy(np.empty(0, dtype=dtype)).dtype
+        if shard_size < 1:
+            raise ValueError(f"`shard_size` must be positive, got {shard_size}.")
+
+        self.path = path
+        self.shape = tuple(int(n) for n in shape)
+        self.torch_dtype = dtype
+        if dtype == torch.bfloat16:
+            self.dtype = np.dtype(np.uint16)
+        else:
+            self.dtype = torch.empty(0, dtype=dtype).numpy().dtype
+        self.shard_size = shard_size
+        self.metadata = metadata or {}
+        self._shards: List[Dict[str, Any]] = []
+        self._shard = None
+        self._labels: List[float] = []
+        self._ids: List[Optional[str]] = []
+        os.makedirs(path, exist_ok=True)
+
+        # a store being (re)written is incomplete until it is closed
+        if os.path.exists(os.path.join(path, HEADER_FILE)):
+            os.remove(os.path.join(path, HEADER_FILE))
+
+    def append(self, grid, label: float, id: Optional[str] = None) -> None:
+        """Append a voxel grid.
+
+        Args:
+            grid: torch.Tensor or np.ndarray with the shape and dtype of the store
+                (bfloat16 grids must be tensors).
+            label: Label of the sample.
+            id: Optional identifier of the sample, e.g. the PDB id.
+        """
+        if isinstance(grid, torch.Tensor):
+            dtype = grid.dtype
+        else:
+            grid = np.asarray(grid)
+            dtype = torch.from_numpy(np.empty(0, dtype=grid.dtype)).dtype
+        if dtype != self.torch_dtype:
+            raise ValueError(
+                "`grid` dtype must be == {}, currently it is {}".format(
+                    self.torch_dtype, grid.dtype
+                )
+            )
+
+        if isinstance(grid, torch.Tensor):
+            grid = grid.detach().cpu()
+            if grid.dtype == torch.bfloat16:
+                grid = grid.view(torch.int16).numpy().view(np.uint16)
+            else:
+                grid = grid.numpy()
+        if grid.shape != self.shape:
+            raise ValueError(
+                "`grid` shape must be == {}, currently it is {}".format(
+                    self.shape, grid.shape
+                )
+            )
+
+        if self._shard is None or self._shards[-1]["n_samples"] == self.shard_size:
+            self._open_shard()
+        shard = self._shards[-1]
+        self._shard[shard["n_samples"]] = grid
+        shard["n_samples"] += 1
+        self._labels.append(float(label))
+        self._ids.append(id)
+
+    def _open_shard(self) -> None:
+        self._flush()
+        file = "shard-{:05d}.npy".format(len(self._shards))
+        self._shard = np.lib.format.open_memmap(
+            os.path.join(self.path, file),
+            mode="w+",
+            dtype=self.dtype,
+            shape=(self.shard_size, *self.shape),
+        )
+        self._shards.append({"file": file, "n_samples": 0})
+
+    def _flush(self) -> None:
+        if self._shard is None:
+            return
+        self._shard.flush()
+        self._shard = None
+
+        # shrink the last shard to its samples
+        shard = self._shards[-1]
+        if shard["n_samples"] < self.shard_size:
+            file = os.path.join(self.path, shard["file"])
+            full = np.load(file, mmap_mode="r")
+            np.save(file + ".tmp.npy", full[: shard["n_samples"]])
+            del full
+            os.replace(file + ".tmp.npy", file)
+
+    def close(self) -> None:
+        """Flush the last shard and write the header."""
+        self._flush()
+        np.save(
+            os.path.join(self.path, LABELS_FILE), np.array(self._labels, np.float32)
+        )
+        header = {
+            "format": STORE_FORMAT,
+            "version": STORE_VERSION,
+            "shape": list(self.shape),
+            "dtype": self.dtype.str,
+            "torch_dtype": str(self.torch_dtype).replace("torch.", ""),
+            "n_samples": len(self._labels),
+            "shards": self._shards,
+            "ids": self._ids,
+            "metadata": self.metadata,
+        }
+        with open(os.path.join(self.path, HEADER_FILE), "w") as f:
+            json.dump(header, f, indent=4)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._flush()  # keep the grids, but leave the store incomplete
+
+
+class VoxelStoreDataset(Dataset):
+    """Dataset of pre-voxelized grids read from a store (see `VoxelStoreWriter`).
+
+    Shards are memory mapped, so a sample is a view of the page cache and reading an
+    epoch is a sequential scan of a few large files. Grids are returned as torch
+    tensors sharing memory with the map (copy-on-write, the store is never
+    modified); transforms on coords, such as `RandomRotation`, do not apply.
+
+    Maps are opened lazily in each process, so the dataset can be sent to DataLoader
+    workers.
+
+    Attrs:
+        header: The header of the store.
+        labels: torch.Tensor of shape (n_samples,).
+        ids: List with the identifier of each sample (or None).
+        shape: Shape of each voxel grid.
+        dtype: torch dtype of the grids, or None for stores of other versions.
+    """
+
+    def __init__(self, path: str):
+        """Open store.
+
+        Args:
+            path: Directory of the store.
+        """
+        with open(os.path.join(path, HEADER_FILE)) as f:
+            header = json.load(f)
+        if header.get("format") != STORE_FORMAT:
+            raise ValueError(f"{path} is not a voxel store.")
+        if header["version"] > STORE_VERSION:
+            raise ValueError(f"Unsupported voxel store version {header['version']}.")
+
+        self.path = path
+        self.header = header
+        self.shape = tuple(header["shape"])
+        self.ids = header["ids"]
+        self.labels = torch.from_numpy(np.load(os.path.join(path, LABELS_FILE)))
+        self.dtype = getattr(torch, header.get("torch_dtype", ""), None)
+
+        # sample i is row i - offsets[s] of the shard s holding it
+        sizes = [shard["n_samples"] for shard in header["shards"]]
+        self._offsets = np.concatenate(([0], np.cumsum(sizes)))
+        self._shards = None
+
+    def __getstate__(self):
+        # maps are not pickled, workers open their own
+        state = self.__dict__.copy()
+        state["_shards"] = None
+        return state
+
+    def _open_shards(self) -> List[np.ndarray]:
+        return [
+            np.load(os.path.join(self.path, shard["file"]), mmap_mode="c")
+            for shard in self.header["shards"]
+        ]
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def __getitem__(self, idx):
+        if self._shards is None:
+            self._shards = self._open_shards()
+        idx = int(idx)
+        if idx < 0:
+            idx += len(self)
+        if not 0 <= idx < len(self):
+            raise IndexError(f"index {idx} is out of range.")
+
+        s = int(np.searchsorted(self._offsets, idx, side="right")) - 1
+        grid = self._shards[s][idx - self._offsets[s]]
+        if self.dtype == torch.bfloat16:  # stored as uint16 bits
+            grid = torch.from_numpy(grid.view(np.int16)).view(self.dtype)
+        else:
+            grid = torch.from_numpy(grid)
+        return grid, self.labels[idx]
+
+
+def write_voxel_store(
+    path: str,
+    dataset,
+    ids: Optional[List[str]] = None,
+    shard_size: int = 1024,
+    metadata: Optional[Dict[str, Any]] = None,
+) -> None:
+    """Voxelize a dataset and write its grids and labels to a store.
+
+    Args:
+        path: Directory of the store.
+        dataset: A `VoxelDataset`.
+        ids: Optional identifier of each sample.
+        shard_size: Number of samples per shard.
+        metadata: JSON serializable dict stored in the header, in addition to the
+            voxel configuration of the dataset (under "voxel").
+    """
+    voxel = dataset.voxel
+    metadata = {
+        "voxel": {
+            "vox_size": voxel.grid.vox_size,
+            "box_dims": voxel.grid.box_dims,
+            "views": [type(v).__name__ for v in voxel.views],
+            "channels": [
+                name
+                for v in voxel.views
+                for name in v.get_channels_names() or [None] * v.get_num_channels()
+            ],
+            "occupancy": type(voxel.occupancy_func).__name__,
+            "cutoff": voxel.cutoff,
+            "engine": voxel.engine,
+        },
+        **(metadata or {}),
+    }
+
+    with VoxelStoreWriter(
+        path, voxel.shape, voxel.dtype, shard_size, metadata
+    ) as writer:
+        for i in range(len(dataset)):
+            grid, label = dataset[i]
+            writer.append(grid, label, None if ids is None else ids[i])
@@ -0,0 +1,97 @@
+"""Benchmark `VoxelGrid.voxelize_batch` against a loop of `VoxelGrid.voxelize` calls.
+
+Complexes are read from a directory with `<pdb>_protein.pdb` and `<pdb>_ligand.pdb`
+files, cropped to their binding pockets, and repeated to fill the batch. Both variants
+are timed in turns, so that they see the same machine load, and the best time of each
+is reported.
+
+Usage examples:
+    python -m scripts.benchmark_batch
+    python -m scripts.benchmark_batch --box-dims 8 8 8 --tol 1e-6
+    python -m scripts.benchmark_batch --memory-budget 1073741824
+
+"""
+
+import argparse
+import glob
+import os
+import time
+
+import torch
+
+from docktgrid import MolecularComplex, VoxelGrid
+from docktgrid.config import DEVICE
+from docktgrid.molparser import MolecularParser
+from docktgrid.view import *
+
+
+def timeit(func):
+    if DEVICE.type == "cuda":
+        torch.cuda.synchronize()
+    stime = time.perf_counter()
+    func()
+    if DEVICE.type == "cuda":
+        torch.cuda.synchronize()
+    return time.perf_counter() - stime
+
+
+def main(args):
+    voxel = VoxelGrid(
+        [eval(v)() for v in args.views],
+        args.voxel_size,
+        args.box_dims,
+        tol=args.tol,
+        memory_budget=args.memory_budget,
+    )
+    pocket_radius, pocket_cutoff = voxel.get_pocket_params()
+    files = sorted(glob.glob(os.path.join(args.dir, "*_protein.pdb")))
+    pdbs = [os.path.basename(f)[: -len("_protein.pdb")] for f in files]
+    parser = MolecularParser()
+    molecules = [
+        MolecularComplex(
+            f"{pdb}_protein.pdb",
+            f"{pdb}_ligand.pdb",
+            parser,
+            args.dir,
+            pocket_radius=pocket_radius,
+            pocket_cutoff=pocket_cutoff,
+        )
+        for pdb in pdbs * (-(-args.batch_size // len(pdbs)))
+    ][: args.batch_size]
+
+    def loop():
+        return torch.stack([voxel.voxelize(m) for m in molecules])
+
+    def batch():
+        return voxel.voxelize_batch(molecules)
+
+    assert torch.allclose(batch(), loop(), atol=1e-5)  # also warms up
+    times = {"loop": [], "batch": []}
+    for _ in range(args.repeats):
+        times["loop"].append(timeit(loop))
+        times["batch"].append(timeit(batch))
+
+    n_atoms = sum(m.n_atoms for m in molecules) / len(molecules)
+    print(f"{len(molecules)} complexes, {n_atoms:.0f} atoms per complex, {voxel.shape}")
+    for name, values in times.items():
+        best = min(values)
+        print(
+            f"{name:>6}: {best:8.3f} s ({best / len(molecules) * 1e3:.2f} ms/complex)"
+        )
+    print(f"speedup: {min(times['loop']) / min(times['batch']):.2f}x")
+
+
+if __name__ == "__main__":
+    # fmt: off
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--dir", default="tests/data/dataset", help="directory with the protein and ligand files")
+    parser.add_argument("--batch-size", type=int, default=40, help="number of complexes")
+    parser.add_argument("--voxel-size", type=float, default=1.0, help="voxel size in Angstroms")
+    parser.add_argument("--box-dims", type=float, nargs=3, default=[12.0, 12.0, 12.0], help="box dimensions in Angstroms")
+    parser.add_argument("--views", nargs="+", type=str, default=["VolumeView", "BasicView"], help="views to use")
+    parser.add_argument("--tol", type=float, default=None, help="occupancy tolerance used to discard far atoms")
+    parser.add_argument("--memory-budget", type=int, default=None, help="memory budget of the dense engine, in bytes")
+    parser.add_argument("--repeats", type=int, default=5, help="number of timed runs")
+    # fmt: on
+    args = parser.parse_args()
+    main(args)
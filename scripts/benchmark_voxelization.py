@@ -0,0 +1,109 @@
+"""Benchmark the channel reduction of the dense voxelization engine.
+
+Compares the segmented reduction used by `VoxelGrid` (atoms grouped by channel
+membership) against the previous variants: a boolean mask copy per channel, and a
+masked `torch.where` over all channels at once.
+
+Usage examples:
+    python -m scripts.benchmark_voxelization
+    python -m scripts.benchmark_voxelization --voxel-size 0.5 --protein tests/data/1pnk.pdb
+
+"""
+
+import argparse
+import time
+
+import torch
+
+from docktgrid import MolecularComplex, VoxelGrid
+from docktgrid.config import DEVICE
+from docktgrid.view import *
+from docktgrid.voxel import get_channel_segments
+
+
+def reduce_per_channel(out, channels, occs):
+    """Previous default: copy the occupancies of each channel's atoms."""
+    for i, mask in enumerate(channels):
+        if torch.any(mask):
+            torch.amax(occs[:, mask], dim=1, out=out[i])
+
+
+def reduce_where(out, channels, occs):
+    """Previous alternative: mask all channels at once with `torch.where`."""
+    mask = channels.view(channels.shape[0], 1, channels.shape[1])
+    out[:, :], _ = torch.max(torch.where(mask, occs.unsqueeze(0), 0), dim=2)
+
+
+def get_occupancies(voxel, molecule):
+    grid = [
+        (u + v).unsqueeze(-1) for u, v in zip(voxel.grid.points, molecule.ligand_center)
+    ]
+    ax, ay, az = molecule.coords.to(DEVICE)
+    px, py, pz = (u.to(DEVICE) for u in grid)
+    dist = torch.sqrt(
+        torch.pow(ax - px, 2) + torch.pow(ay - py, 2) + torch.pow(az - pz, 2)
+    )
+    return 1 - torch.exp(-1 * torch.pow(molecule.vdw_radii.to(DEVICE) / dist, 12))
+
+
+def timeit(func, repeats):
+    func()  # warm up
+    if DEVICE.type == "cuda":
+        torch.cuda.synchronize()
+    stime = time.perf_counter()
+    for _ in range(repeats):
+        func()
+    if DEVICE.type == "cuda":
+        torch.cuda.synchronize()
+    return (time.perf_counter() - stime) / repeats
+
+
+def main(args):
+    molecule = MolecularComplex(args.protein, args.ligand)
+    voxel = VoxelGrid([eval(v)() for v in args.views], args.voxel_size, args.box_dims)
+    channels = voxel.get_channels_mask(molecule).to(DEVICE)
+    n_points = voxel.shape[1] * voxel.shape[2] * voxel.shape[3]
+    out = torch.zeros((voxel.num_channels, n_points), device=DEVICE)
+
+    # the occupancy matrix is shared, so only the reduction differs between variants
+    occs = get_occupancies(voxel, molecule)
+    reference = torch.zeros_like(out)
+    reduce_per_channel(reference, channels, occs)
+
+    # the engine computes the occupancies in the order of the segments already
+    order, offsets, groups = get_channel_segments(channels.cpu())
+    segments = list(zip(offsets[:-1].tolist(), offsets[1:].tolist()))
+    sorted_occs = occs[:, order.to(DEVICE)]
+    groups = groups.to(DEVICE)
+
+    def reduce_segments():
+        out.zero_()
+        for g, (start, end) in enumerate(segments):
+            occ = torch.amax(sorted_occs[:, start:end], dim=1)
+            out[groups[g]] = torch.maximum(out[groups[g]], occ)
+
+    print(f"{molecule.n_atoms} atoms, {n_points} points, {voxel.num_channels} channels")
+    for name, func in (
+        ("per-channel", lambda: reduce_per_channel(out, channels, occs)),
+        ("where", lambda: reduce_where(out, channels, occs)),
+        ("segments", reduce_segments),
+        ("voxelize (total)", lambda: voxel.voxelize(molecule)),
+    ):
+        print(f"{name:>16}: {timeit(func, args.repeats) * 1e3:9.2f} ms")
+
+    reduce_segments()
+    assert torch.allclose(out, reference)
+
+
+if __name__ == "__main__":
+    # fmt: off
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument("--protein", default="tests/data/6rnt_protein.pdb", help="protein file")
+    parser.add_argument("--ligand", default="tests/data/6rnt_ligand.pdb", help="ligand file")
+    parser.add_argument("--voxel-size", type=float, default=1.0, help="voxel size in Angstroms")
+    parser.add_argument("--box-dims", type=float, nargs=3, default=[24.0, 24.0, 24.0], help="box dimensions in Angstroms")
+    parser.add_argument("--views", nargs="+", type=str, default=["VolumeView", "BasicView"], help="views to use")
+    parser.add_argument("--repeats", type=int, default=5, help="number of timed runs")
+    # fmt: on
+    args = parser.parse_args()
+    main(args)
@@ -4,8 +4,13 @@ This script loads protein-ligand files and voxelizes them using the specified pa
 This script assumes protein and ligand for each complex are in separate files and both 
 begin with the same unique identifier, e.g. 1abc_protein.pdb and 1abc_ligand_rnum.pdb.
 
+With `--output-file-format store`, all grids are packed into a single store (sharded
+`.npy` files with a header and the labels), read back with
+`docktgrid.VoxelStoreDataset`, instead of one file per complex.
+
 Usage examples:
     python -m scripts.generate_voxel_dataset --help
+    python -m scripts.generate_voxel_dataset --output-file-format store --shard-size 1024
     
 """
 
@@ -18,7 +23,7 @@ import numpy as np
 import torch
 from tqdm import tqdm
 
-from docktgrid import MolecularParser, VoxelDataset, VoxelGrid
+from docktgrid import MolecularParser, VoxelDataset, VoxelGrid, write_voxel_store
 from docktgrid.view import *
 
 
@@ -40,7 +45,24 @@ def main(args):
 
     protein_mols, ligand_mols = get_molecular_data(protein_files, ligand_files)
     dataset = get_voxel_dataset(args, protein_mols, ligand_mols)
-    generate_and_save_voxels(args, protein_files, ligand_files, dataset)
+    if args.output_file_format == "store":
+        generate_and_save_store(args, protein_files, dataset)
+    else:
+        generate_and_save_voxels(args, protein_files, ligand_files, dataset)
+
+
+def get_basename(args, protein_file):
+    ending_pattern = args.protein_pattern.split("*")[-1]
+    return os.path.basename(protein_file).replace(ending_pattern, "")
+
+
+def generate_and_save_store(args, protein_files, dataset):
+    output_dir = args.output_dir or os.path.dirname(protein_files[0])
+    store_dir = os.path.join(output_dir, "../voxels")
+    ids = [get_basename(args, file) for file in protein_files]
+    write_voxel_store(
+        store_dir, dataset, ids, args.shard_size, metadata={"args": vars(args)}
+    )
 
 
 def generate_and_save_voxels(args, protein_files, ligand_files, dataset):
@@ -55,8 +77,7 @@ def generate_and_save_voxels(args, protein_files, ligand_files, dataset):
 
         os.makedirs(os.path.join(output_dir, "../voxels"), exist_ok=True)
 
-        ending_pattern = args.protein_pattern.split("*")[-1]
-        basename = os.path.basename(protein_files[i]).replace(ending_pattern, "")
+        basename = get_basename(args, protein_files[i])
         output_file = os.path.join(
             output_dir, "../voxels", f"{basename}.{args.output_file_format}"
         )
@@ -140,7 +161,8 @@ if __name__ == "__main__":
     parser.add_argument("--ligand-pattern", default="**/*_ligand_rnum.pdb", help="glob pattern for finding ligand files")
     parser.add_argument("-r", "--recursive", action="store_true", help="search for files recursively")
     parser.add_argument("--output-dir", default="", help="output directory (default: if empty, use the same as the protein file directory)")
-    parser.add_argument("--output-file-format", default="npy", choices=["npy", "pt"], help="output file format")
+    parser.add_argument("--output-file-format", default="npy", choices=["npy", "pt", "store"], help="output file format; 'store' packs all grids in sharded files")
+    parser.add_argument("--shard-size", type=int, default=1024, help="number of grids per shard of the store")
     # fmt: on
     args = parser.parse_args()
     main(args)
@@ -1,6 +1,6 @@
 """Preprocess the dataset for training machine learning models.
 
-This script loads the data files and stores them in serializable file formats, which can 
+This script loads the data files and stores them in serializable file formats, which can
 be quickly loaded and used for training machine learning models.
 
 Usage examples:
@@ -14,6 +14,7 @@ import argparse
 import glob
 import os
 import pickle
+from collections import deque
 
 from tqdm import tqdm
 
@@ -32,25 +33,47 @@ def main(args):
     # create output directory if it doesn't exist
     os.makedirs(args.output, exist_ok=True)
 
-    parser = MolecularParser()
-    for file in tqdm(files):
-        # join ptn and cofacs if they exist
+    # inputs are prepared as the parser takes them, and removed once parsed
+    inputs = deque()
+    parser = MolecularParser(backend=args.backend, keep_object=args.keep_object)
+    outputs = parser.iter_many(
+        prepare_inputs(files, args.output, inputs), workers=args.workers
+    )
+    try:
+        for file, (mol, error) in zip(tqdm(files), outputs):
+            input_file, is_tmp = inputs.popleft()
+            if is_tmp:
+                os.remove(input_file)
+            if error is not None:
+                print(f"Failed to parse {file}: {error!r}")
+                continue
+            with open(
+                os.path.join(args.output, os.path.basename(file) + ".pkl"), "wb"
+            ) as f:
+                pickle.dump(mol, f)
+    finally:
+        outputs.close()
+        for input_file, is_tmp in inputs:
+            if is_tmp:
+                os.remove(input_file)
+
+
+def prepare_inputs(files: list[str], output_dir: str, inputs: deque):
+    """Yield the file to parse for each file, joining proteins and their cofactors.
+
+    Each input is also appended to `inputs` as a tuple (input_file, is_tmp).
+    """
+    for file in files:
         cofactors_dir = os.path.join(os.path.dirname(file), "cofactors")
         if "protein" in file and os.path.exists(cofactors_dir):
             cofactors = get_files("*.pdb", cofactors_dir)
             output_file = os.path.basename(file) + ".cofactors.pdb"  # tmp file
-            output_file = os.path.join(args.output, output_file)
+            output_file = os.path.join(output_dir, output_file)
             join_files([file, *cofactors], output_file)
-            mol = parser.parse_file(output_file, os.path.splitext(output_file)[1])
-            os.remove(output_file)
-
+            inputs.append((output_file, True))
         else:
-            mol = parser.parse_file(file, os.path.splitext(file)[1])
-
-        with open(
-            os.path.join(args.output, os.path.basename(file) + ".pkl"), "wb"
-        ) as f:
-            pickle.dump(mol, f)
+            inputs.append((file, False))
+        yield inputs[-1][0]
 
 
 def join_files(files: list[str], output_file: str) -> None:
@@ -79,6 +102,9 @@ if __name__ == "__main__":
     parser.add_argument("-d", "--dir", default="", help="root directory for data files")
     parser.add_argument("-o", "--output", default="data/processed", help="output directory")
     parser.add_argument("-r", "--recursive", action="store_true", help="recursively search for files")
+    parser.add_argument("-b", "--backend", default="biopandas", choices=MolecularParser.BACKENDS, help="parser for PDB files; 'numpy' is much faster, but does not keep the biopandas object")
+    parser.add_argument("-k", "--keep-object", action="store_true", help="also pickle the biopandas object (much larger files)")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="number of parser processes (default: number of CPUs)")
     parser.add_argument("-f", "--files", default=None, help="a txt file containing the list of files to process, one per line. if provided, --pattern is ignored.")
     # fmt: on
     args = parser.parse_args()
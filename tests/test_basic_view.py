@@ -77,3 +77,23 @@ def test_protein_set():
     assert not protein_set[5][949]
     assert not protein_set[5][0]
     assert not protein_set[1][939]
+
+
+def test_call_matches_channel_sets():
+    c = MolecularComplex(
+        "6rnt_protein.pdb",
+        "6rnt_ligand.pdb",
+        molparser=MolecularParser(),
+        path="tests/data/",
+    )
+    view = BasicView()
+    expected = torch.cat(
+        (
+            view.get_molecular_complex_channels(c),
+            view.get_protein_channels(c),
+            view.get_ligand_channels(c),
+        )
+    )
+
+    assert view.cacheable
+    assert torch.equal(view(c), expected)
@@ -35,3 +35,12 @@ def test_grid_points_have_correct_values():
     np.all(grid.points[0].cpu().numpy() == points[:, 0])
     np.all(grid.points[1].cpu().numpy() == points[:, 1])
     np.all(grid.points[2].cpu().numpy() == points[:, 2])
+
+
+def test_separable_grid_points_are_computed_on_demand():
+    grid = dockt.Grid3D(vox_size=0.5, box_dims=[4.0, 3.0, 2.0])
+    separable = dockt.Grid3D(vox_size=0.5, box_dims=[4.0, 3.0, 2.0], separable=True)
+
+    assert separable._points is None
+    for u, v in zip(grid.points, separable.points):
+        assert torch.equal(u, v)
@@ -1,7 +1,10 @@
+import numpy as np
+import pytest
 import torch
 
 from docktgrid.molecule import MolecularComplex
-from docktgrid.molparser import MolecularParser
+from docktgrid.molparser import MolecularData, MolecularParser
+from docktgrid.periodictable import ptable
 
 
 def test_coords_have_correct_values():
@@ -56,3 +59,66 @@ def test_vdw_radii_are_correct():
     assert c.vdw_radii[953].cpu() == torch.tensor(1.8000)
     assert c.vdw_radii[0].cpu() == torch.tensor(1.5500)
     assert c.vdw_radii[-1].cpu() == torch.tensor(1.1000)
+
+
+def test_complex_with_sdf_ligand(tmp_path):
+    ligand = MolecularParser().parse_file("tests/data/6rnt_ligand.mol2", ".mol2")
+    lines = ["6rnt_ligand", "  test", ""]
+    lines.append(f"{ligand.coords.shape[1]:3d}  0  0  0  0  0  0  0  0  0999 V2000")
+    for (x, y, z), symbol in zip(ligand.coords.T.tolist(), ligand.element_symbols):
+        lines.append(f"{x:10.4f}{y:10.4f}{z:10.4f} {symbol:<3} 0  0  0  0  0  0")
+    (tmp_path / "6rnt_ligand.sdf").write_text("\n".join(lines + ["M  END", "$$$$", ""]))
+
+    c = MolecularComplex(
+        MolecularParser().parse_file("tests/data/6rnt_protein.pdb", ".pdb"),
+        "6rnt_ligand.sdf",
+        molparser=MolecularParser(),
+        path=str(tmp_path),
+    )
+    assert c.n_atoms_ligand == ligand.coords.shape[1]
+    assert torch.allclose(c.coords[:, c.n_atoms_protein :], ligand.coords)
+    assert c.element_symbols[-1] == ligand.element_symbols[-1]
+
+
+def test_atomic_numbers_and_vdw_radii():
+    c = MolecularComplex(
+        "6rnt_protein.pdb",
+        "6rnt_ligand.pdb",
+        molparser=MolecularParser(),
+        path="tests/data",
+    )
+    assert c.atomic_numbers.shape == (c.n_atoms,)
+    assert c.atomic_numbers[0] == 7 and c.atomic_numbers[952] == 20  # N, Ca
+    expected = [ptable[s]["vdw"] for s in c.element_symbols]
+    assert torch.equal(c.vdw_radii, torch.tensor(expected, dtype=torch.float32))
+
+
+def test_unknown_elements_raise():
+    ligand = MolecularData(None, torch.zeros(3, 2), np.array(["C", "Xx"]))
+    protein = MolecularData(None, torch.zeros(3, 1), np.array(["N"]))
+    with pytest.raises(ValueError, match="X"):
+        MolecularComplex(protein, ligand)
+
+
+def test_crop_pocket():
+    protein = MolecularParser().parse_file("tests/data/1pnk.pdb", ".pdb")
+    ligand = MolecularParser().parse_file("tests/data/6rnt_ligand.pdb", ".pdb")
+    full = MolecularComplex(protein, ligand)
+    c = MolecularComplex(protein, ligand, pocket_radius=10.0, pocket_cutoff=2.0)
+
+    dists = torch.norm(
+        full.coords[:, : full.n_atoms_protein] - c.ligand_center[:, None], dim=0
+    )
+    expected = torch.nonzero(
+        dists < 10.0 + 2.0 * full.vdw_radii[: full.n_atoms_protein]
+    )
+    assert torch.equal(c.pocket_indices, expected.squeeze(1))
+    assert c.n_atoms_protein == len(c.pocket_indices) < full.n_atoms_protein
+    assert c.n_atoms_ligand == full.n_atoms_ligand
+    assert torch.equal(
+        c.coords[:, c.n_atoms_protein :], full.coords[:, full.n_atoms_protein :]
+    )
+    assert np.array_equal(
+        c.atomic_numbers[: c.n_atoms_protein], full.atomic_numbers[c.pocket_indices]
+    )
+    assert full.pocket_indices is None
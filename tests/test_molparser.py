@@ -1,8 +1,19 @@
+import gzip
 import os
+import pickle
+from concurrent.futures import ThreadPoolExecutor
 
+import numpy as np
+import pytest
 import torch
+from biopandas import pdb
 
-from docktgrid.molparser import MolecularParser
+from docktgrid.molparser import (
+    MolecularData,
+    MolecularParser,
+    get_file_format,
+    read_pdb_atoms,
+)
 
 
 def test_get_coords():
@@ -39,3 +50,362 @@ def test_get_element_symbols_mol2():
     ).element_symbols
 
     assert names[0] == "P"
+
+
+@pytest.mark.parametrize(
+    "file",
+    [
+        "tests/data/1pnk.pdb",
+        "tests/data/6rnt_protein.pdb",
+        "tests/data/6rnt_ligand.pdb",
+    ],
+)
+def test_numpy_backend_matches_biopandas(file):
+    expected = MolecularParser().parse_file(file, ".pdb")
+    mol = MolecularParser(backend="numpy").parse_file(file, ".pdb")
+
+    assert mol.molecule_object is None
+    assert torch.equal(mol.coords, expected.coords)
+    assert mol.element_symbols.tolist() == expected.element_symbols.tolist()
+
+
+def test_read_pdb_atoms(tmp_path):
+    file = tmp_path / "mol.pdb"
+    file.write_text(
+        "REMARK   1 ATOM-LIKE REMARK\n"
+        "HETATM    3  O   HOH A   3      -1.000   0.500  10.250  1.00  0.00           O\n"
+        "ATOM      1  N   ALA A   1       6.905  -5.627  16.260  1.00  0.00           N\n"
+        "ATOM      2  CA  ALA A   1       6.234  -4.818  15.182\n"
+        "TER\n"
+    )
+    coords, symbols = read_pdb_atoms(str(file))
+
+    assert np.allclose(
+        coords, [[6.905, -5.627, 16.26], [6.234, -4.818, 15.182], [-1.0, 0.5, 10.25]]
+    )
+    assert symbols.tolist() == ["N", "", "O"]
+
+
+def test_unknown_backend():
+    with pytest.raises(NotImplementedError):
+        MolecularParser(backend="unknown")
+
+
+SDF_V2000 = """water
+  test
+
+  3  2  0  0  0  0  0  0  0  0999 V2000
+    0.0000    0.0000    0.1173 O   0  0  0  0  0  0  0  0  0  0  0  0
+    0.0000    0.7572   -0.4692 H   0  0  0  0  0  0  0  0  0  0  0  0
+    0.0000   -0.7572   -0.4692 H   0  0  0  0  0  0  0  0  0  0  0  0
+  1  2  1  0
+  1  3  1  0
+M  END
+> <ID>
+water
+
+$$$$
+"""
+
+SDF_V3000 = """chloromethane
+  test
+
+  0  0  0     0  0            999 V3000
+M  V30 BEGIN CTAB
+M  V30 COUNTS 2 1 0 0 0
+M  V30 BEGIN ATOM
+M  V30 1 C -0.5 1.25 0 0
+M  V30 2 Cl 1.25 0 -2 0
+M  V30 END ATOM
+M  V30 BEGIN BOND
+M  V30 1 1 1 2
+M  V30 END BOND
+M  V30 END CTAB
+M  END
+$$$$
+"""
+
+
+def test_iter_molecules_sdf(tmp_path):
+    file = tmp_path / "library.sdf"
+    file.write_text(SDF_V2000 + SDF_V3000 + SDF_V2000)
+    molecules = list(MolecularParser().iter_molecules(str(file), ".sdf"))
+
+    assert [m.element_symbols.tolist() for m in molecules] == [
+        ["O", "H", "H"],
+        ["C", "Cl"],
+        ["O", "H", "H"],
+    ]
+    assert torch.equal(molecules[0].coords[:, 1], torch.tensor([0.0, 0.7572, -0.4692]))
+    assert torch.equal(
+        molecules[1].coords, torch.tensor([[-0.5, 1.25], [1.25, 0], [0, -2]])
+    )
+
+    # a single molecule without the "$$$$" delimiter, as in MOL files
+    file.write_text(SDF_V2000.split("M  END")[0] + "M  END\n")
+    mol = MolecularParser().parse_file(str(file), ".sdf")
+    assert mol.coords.shape == (3, 3)
+
+
+def test_iter_molecules_mol2(tmp_path):
+    file = "tests/data/6rnt_ligand.mol2"
+    expected = MolecularParser().parse_file(file, ".mol2")
+    with open(file) as f:
+        content = f.read()
+
+    multi = tmp_path / "library.mol2"
+    multi.write_text(content * 3)
+    molecules = list(MolecularParser().iter_molecules(str(multi), ".mol2"))
+
+    assert len(molecules) == 3
+    for mol in molecules:
+        assert mol.molecule_object is None
+        assert torch.equal(mol.coords, expected.coords)
+        assert mol.element_symbols.tolist() == expected.element_symbols.tolist()
+
+    with pytest.raises(NotImplementedError):
+        next(MolecularParser().iter_molecules(file, ".pdb"))
+
+
+def write_mmcif(file, pdb_file):
+    """Write the atoms of a PDB file as a minimal mmCIF file."""
+    mol = pdb.PandasPdb().read_pdb(pdb_file)
+    columns = [
+        "group_PDB",
+        "id",
+        "type_symbol",
+        "label_atom_id",
+        "label_alt_id",
+        "label_comp_id",
+        "label_asym_id",
+        "label_entity_id",
+        "label_seq_id",
+        "pdbx_PDB_ins_code",
+        "Cartn_x",
+        "Cartn_y",
+        "Cartn_z",
+        "occupancy",
+        "B_iso_or_equiv",
+        "pdbx_formal_charge",
+        "auth_seq_id",
+        "auth_comp_id",
+        "auth_asym_id",
+        "auth_atom_id",
+        "pdbx_PDB_model_num",
+    ]
+    lines = ["data_TEST", "#", "_entry.id TEST", "#", "loop_"]
+    lines += [f"_atom_site.{c}" for c in columns]
+    for record in ("HETATM", "ATOM"):  # mixed order, ATOM records are listed first
+        for _, a in mol.df[record].iterrows():
+            name = f'"{a.atom_name}"' if "'" in a.atom_name else a.atom_name
+            lines.append(
+                f"{record} {a.atom_number} {a.element_symbol} {name} . "
+                f"{a.residue_name} A 1 {a.residue_number} ? "
+                f"{a.x_coord} {a.y_coord} {a.z_coord} 1.00 0.00 ? "
+                f"{a.residue_number} {a.residue_name} A {name} 1"
+            )
+    lines += ["#", "loop_", "_atom_site_anisotrop.id", "1", "#"]
+    file.write_text("\n".join(lines) + "\n")
+
+
+@pytest.mark.parametrize("backend", MolecularParser.BACKENDS)
+def test_parse_mmcif(tmp_path, backend):
+    file = "tests/data/6rnt_protein.pdb"
+    expected = MolecularParser().parse_file(file, ".pdb")
+    write_mmcif(tmp_path / "6rnt_protein.cif", file)
+
+    mol = MolecularParser(backend).parse_file(
+        str(tmp_path / "6rnt_protein.cif"), ".cif"
+    )
+    assert torch.equal(mol.coords, expected.coords)
+    assert mol.element_symbols.tolist() == expected.element_symbols.tolist()
+
+
+@pytest.mark.parametrize("backend", MolecularParser.BACKENDS)
+@pytest.mark.parametrize(
+    "file", ["6rnt_protein.pdb", "6rnt_ligand.mol2", "6rnt_protein.cif"]
+)
+def test_parse_gzipped_files(tmp_path, backend, file):
+    if file.endswith(".cif"):
+        write_mmcif(tmp_path / file, "tests/data/6rnt_protein.pdb")
+        file = str(tmp_path / file)
+    else:
+        file = os.path.join("tests/data", file)
+    with open(file, "rb") as f, gzip.open(tmp_path / "mol.gz", "wb") as g:
+        g.write(f.read())
+    gzipped = str(tmp_path / (os.path.basename(file) + ".gz"))
+    os.rename(tmp_path / "mol.gz", gzipped)
+
+    parser = MolecularParser(backend)
+    expected = parser.parse_file(file, os.path.splitext(file)[1])
+    for ext in (".gz", os.path.splitext(file)[1] + ".gz"):
+        mol = parser.parse_file(gzipped, ext)
+        assert torch.equal(mol.coords, expected.coords)
+        assert mol.element_symbols.tolist() == expected.element_symbols.tolist()
+
+
+def test_get_file_format():
+    assert get_file_format("a.pdb", ".pdb") == "pdb"
+    assert get_file_format("a.PDB.gz", ".gz") == "pdb"
+    assert get_file_format("a.cif.gz", ".cif.gz") == "cif"
+    assert get_file_format("a.mmcif", "mmcif") == "cif"
+    assert get_file_format("a.xyz", ".xyz") == "xyz"
+
+
+def test_molecular_data_is_compact():
+    file = "tests/data/6rnt_protein.pdb"
+    mol = MolecularParser().parse_file(file, ".pdb")
+    assert mol.molecule_object is None
+    assert mol.atomic_numbers.dtype == np.uint8
+    assert mol.atomic_numbers[0] == 7 and mol.element_symbols[0] == "N"
+    assert not hasattr(mol, "__dict__")
+
+    kept = MolecularParser(keep_object=True).parse_file(file, ".pdb")
+    assert isinstance(kept.molecule_object, pdb.PandasPdb)
+    assert len(pickle.dumps(mol)) < len(pickle.dumps(kept)) / 10
+
+    clone = pickle.loads(pickle.dumps(mol))
+    assert torch.equal(clone.coords, mol.coords)
+    assert np.array_equal(clone.atomic_numbers, mol.atomic_numbers)
+
+
+def test_unpickle_legacy_molecular_data():
+    mol = MolecularData.__new__(MolecularData)
+    mol.__setstate__(
+        {
+            "molecule_object": None,
+            "coords": torch.zeros(3, 2),
+            "element_symbols": np.array(["C", "ZN"]),
+        }
+    )
+    assert mol.atomic_numbers.tolist() == [6, 30]
+    assert mol.element_symbols.tolist() == ["C", "Zn"]
+
+
+def test_parse_cache(tmp_path):
+    files = []
+    for name in ("6rnt_protein.pdb", "6rnt_ligand.pdb", "5ljt_ligand.pdb"):
+        files.append(str(tmp_path / name))
+        with open(os.path.join("tests/data", name)) as f:
+            (tmp_path / name).write_text(f.read())
+
+    parser = MolecularParser(cache_size=2)
+    protein = parser.parse_file(files[0], ".pdb")
+    assert parser.parse_file(files[0], ".pdb") is protein
+
+    # least recently used entries are evicted
+    parser.parse_file(files[1], ".pdb")
+    parser.parse_file(files[0], ".pdb")
+    parser.parse_file(files[2], ".pdb")
+    assert parser.parse_file(files[0], ".pdb") is protein
+    assert len(parser._cache) == 2
+
+    # modified files are parsed again
+    stat = os.stat(files[0])
+    os.utime(files[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert parser.parse_file(files[0], ".pdb") is not protein
+
+    clone = pickle.loads(pickle.dumps(parser))
+    assert len(clone._cache) == 2
+    parser.clear_cache()
+    assert len(parser._cache) == 0
+
+
+def test_parse_disk_cache(tmp_path):
+    file = "tests/data/6rnt_protein.pdb"
+    parser = MolecularParser(cache_dir=str(tmp_path / "cache"))
+    mol = parser.parse_file(file, ".pdb")
+    assert len(os.listdir(tmp_path / "cache")) == 1
+
+    # another parser reads the stored file, another backend parses it again
+    cached = MolecularParser(cache_dir=str(tmp_path / "cache")).parse_file(file, ".pdb")
+    assert torch.equal(cached.coords, mol.coords)
+    assert np.array_equal(cached.atomic_numbers, mol.atomic_numbers)
+    MolecularParser("numpy", cache_dir=str(tmp_path / "cache")).parse_file(file, ".pdb")
+    assert len(os.listdir(tmp_path / "cache")) == 2
+
+
+@pytest.mark.parametrize("executor", ["thread", "process"])
+def test_parse_many(tmp_path, executor):
+    files = [
+        "tests/data/6rnt_protein.pdb",
+        "tests/data/6rnt_ligand.pdb",
+        str(tmp_path / "missing.pdb"),
+        "tests/data/5ljt_ligand.pdb",
+    ]
+    parser = MolecularParser()
+    results, errors = parser.parse_many(files, workers=2, executor=executor)
+
+    assert list(errors) == [2]
+    assert isinstance(errors[2], FileNotFoundError)
+    assert results[2] is None
+    for file, mol in zip(files[:2] + files[3:], results[:2] + results[3:]):
+        expected = parser.parse_file(file, ".pdb")
+        assert torch.equal(mol.coords, expected.coords)
+        assert np.array_equal(mol.atomic_numbers, expected.atomic_numbers)
+
+
+def test_parse_many_without_cache_in_workers():
+    parser = MolecularParser(cache_size=4)
+    parser.parse_file("tests/data/6rnt_ligand.pdb", ".pdb")
+    parser._cache["unpicklable"] = lambda: None  # workers get no cached files
+
+    results, errors = parser.parse_many(["tests/data/6rnt_ligand.pdb"], workers=1)
+    assert not errors
+    assert results[0].coords.shape[1] > 0
+
+
+@pytest.mark.parametrize("executor", ["process", "thread"])
+def test_iter_many(executor):
+    files = ["tests/data/6rnt_ligand.pdb", "tests/data/5ljt_ligand.pdb"] * 3
+    parser = MolecularParser()
+    taken = []
+
+    def lazy_files():
+        for file in files:
+            taken.append(file)
+            yield file
+
+    outputs = parser.iter_many(lazy_files(), workers=1, executor=executor)
+    mol, error = next(outputs)
+    assert error is None
+    assert len(taken) < len(files)  # files are taken as workers need them
+
+    outputs = [(mol, error), *outputs]
+    assert len(outputs) == len(files)
+    for file, (mol, error) in zip(files, outputs):
+        assert error is None
+        assert torch.equal(mol.coords, parser.parse_file(file, ".pdb").coords)
+
+    with pytest.raises(NotImplementedError):
+        parser.iter_many(files, executor="cluster")
+
+
+def test_parse_file_from_threads():
+    files = ["tests/data/6rnt_protein.pdb", "tests/data/6rnt_ligand.pdb"] * 4
+    exts = [".pdb"] * len(files)
+    parser = MolecularParser()
+    expected = [parser.parse_file(f, e) for f, e in zip(files, exts)]
+
+    # a single parser is shared by all threads
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(parser.parse_file, files, exts))
+    for mol, ref in zip(results, expected):
+        assert torch.equal(mol.coords, ref.coords)
+        assert np.array_equal(mol.atomic_numbers, ref.atomic_numbers)
+
+
+@pytest.mark.parametrize("backend", MolecularParser.BACKENDS)
+def test_parse_atom_and_residue_names(tmp_path, backend):
+    parser = MolecularParser(backend)
+    protein = parser.parse_file("tests/data/6rnt_protein.pdb", ".pdb")
+    assert protein.atom_names[:2].tolist() == [b"N", b"CA"]
+    assert protein.residue_names[-1] == b"CA"
+
+    write_mmcif(tmp_path / "6rnt_protein.cif", "tests/data/6rnt_protein.pdb")
+    mmcif = parser.parse_file(str(tmp_path / "6rnt_protein.cif"), ".cif")
+    assert np.array_equal(mmcif.atom_names, protein.atom_names)
+    assert np.array_equal(mmcif.residue_names, protein.residue_names)
+
+    ligand = parser.parse_file("tests/data/6rnt_ligand.mol2", ".mol2")
+    assert ligand.atom_names[0] == b"P" and ligand.residue_names[0] == b"LIG"
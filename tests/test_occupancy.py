@@ -0,0 +1,81 @@
+import math
+
+import pytest
+import torch
+
+from docktgrid.occupancy import (
+    BinaryOccupancy,
+    GaussianOccupancy,
+    LookupOccupancy,
+    VdwOccupancy,
+    get_occupancy_model,
+    vdw_cutoff,
+)
+from docktgrid.molecule import MolecularComplex
+from docktgrid.molparser import MolecularParser
+from docktgrid.view import BasicView, VolumeView
+from docktgrid.voxel import VoxelGrid
+
+MOLECULE = MolecularComplex(
+    "6rnt_protein.pdb", "6rnt_ligand.pdb", MolecularParser(), path="tests/data/"
+)
+
+
+def test_vdw_occupancy_values():
+    dist, vdw = torch.tensor([0.5, 1.7, 3.0]), 1.7
+    occs = VdwOccupancy()((dist / vdw) ** 2)
+    assert torch.allclose(occs, 1 - torch.exp(-((vdw / dist) ** 12)))
+
+
+def test_models_are_below_tolerance_beyond_cutoff():
+    for model in (VdwOccupancy(), GaussianOccupancy(), BinaryOccupancy()):
+        cutoff = model.get_cutoff(1e-4)
+        ratio2 = torch.tensor([cutoff**2 * 1.0001, cutoff**2 * 4], dtype=torch.float64)
+        assert torch.all(model(ratio2) < 1e-4)
+
+    assert math.isclose(vdw_cutoff(1e-4), VdwOccupancy().get_cutoff(1e-4))
+    with pytest.raises(ValueError):
+        GaussianOccupancy().get_cutoff(1.0)
+
+
+def test_lookup_occupancy_interpolates_model():
+    ratio2 = torch.linspace(0, 20, 10000)
+    lut = LookupOccupancy(VdwOccupancy(), resolution=4096)
+    assert torch.allclose(lut(ratio2), VdwOccupancy()(ratio2), atol=1e-4)
+    assert lut(torch.tensor([1e3])) == 0  # beyond the table
+
+    lut = LookupOccupancy(GaussianOccupancy(), resolution=4096)
+    assert torch.allclose(lut(ratio2), GaussianOccupancy()(ratio2), atol=1e-4)
+
+
+def test_binary_occupancy():
+    occs = BinaryOccupancy()(torch.tensor([0.0, 1.0, 1.01]))
+    assert torch.equal(occs, torch.tensor([1.0, 1.0, 0.0]))
+
+
+def test_get_occupancy_model():
+    assert isinstance(get_occupancy_model("vdw"), VdwOccupancy)
+    assert isinstance(get_occupancy_model("vdw_lut"), LookupOccupancy)
+    assert isinstance(get_occupancy_model("binary"), BinaryOccupancy)
+    assert isinstance(get_occupancy_model("gaussian"), GaussianOccupancy)
+
+    model = GaussianOccupancy()
+    assert get_occupancy_model(model) is model
+
+    with pytest.raises(NotImplementedError):
+        get_occupancy_model("unknown")
+
+
+def test_voxel_grid_occupancy_models():
+    vdw = VoxelGrid([VolumeView(), BasicView()], 1.0, [24.0, 24.0, 24.0], "vdw")
+    lut = VoxelGrid([VolumeView(), BasicView()], 1.0, [24.0, 24.0, 24.0], "vdw_lut")
+    assert torch.allclose(lut.voxelize(MOLECULE), vdw.voxelize(MOLECULE), atol=1e-4)
+
+    for occ in ("binary", "gaussian"):
+        dense = VoxelGrid([VolumeView()], 1.0, [24.0, 24.0, 24.0], occ)
+        stamp = VoxelGrid([VolumeView()], 1.0, [24.0, 24.0, 24.0], occ, engine="stamp")
+        grid = dense.voxelize(MOLECULE)
+        assert torch.allclose(grid, stamp.voxelize(MOLECULE), atol=1e-5)
+
+        if occ == "binary":
+            assert torch.all((grid == 0) | (grid == 1))
@@ -26,3 +26,11 @@ def test_random_rotation_is_actually_rotating():
 
     assert not torch.allclose(complex.coords, complex_unrotated.coords)
     assert not torch.allclose(complex.ligand_center, complex_unrotated.ligand_center)
+
+
+def test_random_rotation_matrices():
+    rotations = RandomRotation().get_matrices(4)
+    assert rotations.shape == (4, 3, 3)
+    eye = torch.eye(3).expand(4, 3, 3)
+    assert torch.allclose(rotations @ rotations.transpose(1, 2), eye, atol=1e-6)
+    assert torch.allclose(torch.det(rotations), torch.ones(4), atol=1e-6)
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+import torch
+
+from docktgrid.molecule import MolecularComplex
+from docktgrid.molparser import MolecularParser
+from docktgrid.periodictable import atomic_symbols
+from docktgrid.view import BasicView, TableView
+
+
+def setup_complex():
+    return MolecularComplex(
+        "6rnt_protein.pdb",
+        "6rnt_ligand.pdb",
+        molparser=MolecularParser(),
+        path="tests/data/",
+    )
+
+
+def test_element_rules_match_basic_view():
+    names = ["carbon", "hydrogen", "oxygen", "nitrogen", "sulfur"]
+    elements = ["C", "H", "O", "N", "S"]
+    channels = {n: {"element": e} for n, e in zip(names, elements)}
+    channels["other"] = {
+        "element": [s for s in atomic_symbols[1:] if s not in elements]
+    }
+
+    c = setup_complex()
+    view = TableView(complex=channels, protein=channels, ligand=channels)
+    assert view.get_num_channels() == BasicView().get_num_channels()
+    assert view.get_channels_names() == BasicView().get_channels_names()
+    assert torch.equal(view(c), BasicView()(c))
+    assert torch.equal(view.get_ligand_channels(c), BasicView().get_ligand_channels(c))
+
+
+def test_residue_and_atom_rules():
+    c = setup_complex()
+    view = TableView(
+        protein={
+            "backbone": {"atom": ["N", "CA", "C", "O"]},
+            "donor": [
+                {"residue": "ARG", "atom": ["NE", "NH1", "NH2"]},
+                {"residue": "LYS", "atom": "NZ"},
+            ],
+            "calcium": {"element": "Ca", "residue": "CA"},
+        },
+        ligand={"phosphorus": {"element": "P"}},
+    )
+    chs = view(c).numpy()
+    n_protein = c.n_atoms_protein
+    atoms, residues = c.atom_names, c.residue_names
+
+    backbone = np.isin(atoms[:n_protein], [b"N", b"CA", b"C", b"O"])
+    donor = (residues == b"ARG") & np.isin(atoms, [b"NE", b"NH1", b"NH2"])
+    donor |= (residues == b"LYS") & (atoms == b"NZ")
+    assert chs.shape == (4, c.n_atoms)
+    assert np.array_equal(chs[0, :n_protein], backbone)
+    assert np.array_equal(chs[1, :n_protein], donor[:n_protein])
+    assert chs[1].any() and chs[2].sum() == 1
+    assert chs[2, n_protein - 1]  # the calcium ion, not the CA atoms
+    assert not chs[:3, n_protein:].any()
+    assert not chs[3, :n_protein].any() and chs[3, n_protein]
+
+
+def test_invalid_rules():
+    with pytest.raises(ValueError):
+        TableView(protein={"x": {"resname": "ALA"}})
+    with pytest.raises(ValueError):
+        TableView(protein={"x": {"element": "Xx"}})
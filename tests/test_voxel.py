@@ -1,11 +1,30 @@
+import copy
+import math
+import pickle
 import time
 
+import pytest
 import torch
 
 from docktgrid.molecule import MolecularComplex
 from docktgrid.molparser import MolecularParser
-from docktgrid.view import BasicView, VolumeView
-from docktgrid.voxel import VoxelGrid
+from docktgrid.view import (
+    BasicView,
+    TableView,
+    VolumeView,
+    pack_channels,
+    unpack_channels,
+)
+from docktgrid.occupancy import vdw_cutoff
+from docktgrid.transforms import RandomRotation
+from docktgrid.voxel import (
+    VoxelGrid,
+    _get_atom_tiles,
+    densify,
+    dequantize,
+    get_channel_segments,
+    to_sparse,
+)
 
 
 def test_num_channels():
@@ -35,6 +54,27 @@ def test_voxel_build_channels_matrix():
     assert channels.shape == (3 * 6, molecule.n_atoms)
 
 
+def test_channels_mask_cache():
+    molecule = MolecularComplex(
+        "6rnt_protein.pdb", "6rnt_ligand.pdb", MolecularParser(), path="tests/data/"
+    )
+    vox = VoxelGrid([VolumeView(), BasicView()], 0.5, [12.0, 12.0, 12.0])
+    channels = vox.get_channels_mask(molecule)
+    assert vox.get_channels_mask(molecule) is channels
+
+    # other views get their own masks
+    other = VoxelGrid([BasicView()], 0.5, [12.0, 12.0, 12.0])
+    assert torch.equal(other.get_channels_mask(molecule), channels[3:])
+    assert len(molecule.channels_cache) == 2
+
+    class CoordsView(VolumeView):
+        cacheable = False
+
+    vox = VoxelGrid([CoordsView()], 0.5, [12.0, 12.0, 12.0])
+    assert not vox.cacheable
+    assert vox.get_channels_mask(molecule) is not vox.get_channels_mask(molecule)
+
+
 def test_voxel_grid():
     molecule = MolecularComplex(
         "6rnt_protein.pdb", "6rnt_ligand.pdb", MolecularParser(), path="tests/data/"
@@ -63,3 +103,339 @@ VOXEL = VoxelGrid([VolumeView(), BasicView()], 1.0, [24.0, 24.0, 24.0])
 
 def test_voxelize():
     VOXEL.voxelize(MOLECULE)
+
+
+def test_vdw_cutoff_from_tolerance():
+    cutoff = vdw_cutoff(1e-6)
+    occ = 1 - math.exp(-((1 / cutoff) ** 12))
+    assert math.isclose(occ, 1e-6, rel_tol=1e-3)
+
+    with pytest.raises(ValueError):
+        vdw_cutoff(0.0)
+    with pytest.raises(ValueError):
+        VoxelGrid([VolumeView()], 1.0, [24.0, 24.0, 24.0], cutoff=3.0, tol=1e-6)
+
+
+def test_voxel_grid_with_cutoff():
+    vox = VoxelGrid([VolumeView(), BasicView()], 1.0, [24.0, 24.0, 24.0], tol=1e-6)
+    keep = vox.get_atoms_within_cutoff(
+        MOLECULE.coords, MOLECULE.vdw_radii, MOLECULE.ligand_center
+    )
+    assert 0 < keep.sum() < MOLECULE.n_atoms
+
+    grid = vox.voxelize(MOLECULE)
+    assert torch.allclose(grid.cpu(), VOXEL.voxelize(MOLECULE).cpu(), atol=1e-6)
+
+
+def test_voxel_grid_cells_engine():
+    vox = VoxelGrid(
+        [VolumeView(), BasicView()], 1.0, [24.0, 24.0, 24.0], engine="cells"
+    )
+    assert vox.cutoff == vdw_cutoff(1e-6)
+
+    grid = vox.voxelize(MOLECULE)
+    assert grid.shape == VOXEL.shape
+    assert torch.allclose(grid.cpu(), VOXEL.voxelize(MOLECULE).cpu(), atol=1e-5)
+
+    # grid dims not divisible by the cell size
+    vox = VoxelGrid([VolumeView()], 0.5, [11.5, 7.0, 9.5], engine="cells")
+    dense = VoxelGrid([VolumeView()], 0.5, [11.5, 7.0, 9.5])
+    assert torch.allclose(vox.voxelize(MOLECULE), dense.voxelize(MOLECULE), atol=1e-5)
+
+    with pytest.raises(NotImplementedError):
+        VoxelGrid([VolumeView()], 1.0, [24.0, 24.0, 24.0], engine="unknown")
+
+
+def test_voxel_grid_stamp_engine():
+    vox = VoxelGrid(
+        [VolumeView(), BasicView()], 1.0, [24.0, 24.0, 24.0], engine="stamp"
+    )
+    grid = vox.voxelize(MOLECULE)
+
+    assert grid.shape == VOXEL.shape
+    assert torch.allclose(grid.cpu(), VOXEL.voxelize(MOLECULE).cpu(), atol=1e-5)
+
+    stencil = vox.get_stencil(1.7)
+    assert stencil.shape[0] == 3
+    assert vox.get_stencil(1.7) is stencil  # cached
+    assert vox.get_stencil(1.1).shape[1] < stencil.shape[1]
+
+
+def test_voxel_grid_with_memory_budget():
+    vox = VoxelGrid([VolumeView(), BasicView()], 1.0, [24.0, 24.0, 24.0])
+    assert vox.get_tile_sizes(13824, MOLECULE.n_atoms) == (13824, MOLECULE.n_atoms)
+
+    # points are only split if a single atom does not fit with the whole grid
+    vox.memory_budget = 2**20
+    point_tile, atom_tile = vox.get_tile_sizes(13824, MOLECULE.n_atoms)
+    assert point_tile == 13824
+    assert point_tile * atom_tile * vox.BYTES_PER_PAIR <= 2**20
+
+    vox.memory_budget = 1000 * vox.BYTES_PER_PAIR
+    assert vox.get_tile_sizes(13824, MOLECULE.n_atoms, step=576) == (576, 1)
+    assert vox.get_tile_sizes(13824, MOLECULE.n_atoms) == (1000, 1)
+
+    vox.memory_budget = 2**20
+    assert torch.allclose(vox.voxelize(MOLECULE), VOXEL.voxelize(MOLECULE))
+
+    vox = VoxelGrid([VolumeView()], 1.0, [8.0, 8.0, 8.0], memory_budget=4000)
+    dense = VoxelGrid([VolumeView()], 1.0, [8.0, 8.0, 8.0])
+    assert torch.allclose(vox.voxelize(MOLECULE), dense.voxelize(MOLECULE))
+
+
+def test_voxelize_with_out():
+    out = torch.ones(VOXEL.shape)
+    grid = VOXEL.voxelize(MOLECULE, out=out)
+    assert torch.allclose(grid.cpu(), VOXEL.voxelize(MOLECULE).cpu())
+
+
+def test_voxelize_with_mismatched_out():
+    vox = VoxelGrid([VolumeView()], 1.0, [8.0, 8.0, 8.0])
+    rotations = torch.eye(3)[None]
+    poses = MOLECULE.coords[None, :, MOLECULE.n_atoms_protein :]
+
+    # `out` is never silently copied to the dtype of the grids
+    with pytest.raises(ValueError):
+        vox.voxelize(MOLECULE, out=torch.zeros(vox.shape, dtype=torch.float64))
+    with pytest.raises(ValueError):
+        vox.voxelize(MOLECULE, out=torch.zeros(vox.shape).numpy())
+    with pytest.raises(ValueError):
+        vox.voxelize_batch([MOLECULE], out=torch.zeros(1, *vox.shape).half())
+    with pytest.raises(ValueError):
+        vox.voxelize_poses(MOLECULE, poses, out=torch.zeros(1, *vox.shape).half())
+    with pytest.raises(ValueError):
+        vox.voxelize_rotations(MOLECULE, rotations, out=torch.zeros(2, *vox.shape))
+    with pytest.raises(ValueError):
+        vox.voxelize_rotations(
+            MOLECULE, rotations, out=torch.zeros(1, *vox.shape, device="meta")
+        )
+
+    out = torch.ones(1, *vox.shape)
+    assert vox.voxelize_rotations(MOLECULE, rotations, out=out) is out
+
+
+def test_voxelize_batch():
+    ligand_only = MolecularComplex(
+        "6rnt_ligand.pdb", "6rnt_ligand.mol2", MolecularParser(), path="tests/data/"
+    )
+    molecules = [MOLECULE, ligand_only, MOLECULE]
+    vox = VoxelGrid([VolumeView(), BasicView()], 1.0, [24.0, 24.0, 24.0], tol=1e-6)
+    grids = vox.voxelize_batch(molecules)
+    assert grids.shape == (3, *vox.shape)
+    for grid, molecule in zip(grids, molecules):
+        assert torch.allclose(grid, vox.voxelize(molecule), atol=1e-5)
+
+    # atoms of a complex split across tiles
+    vox = VoxelGrid([BasicView()], 1.0, [4.0, 4.0, 4.0], memory_budget=500 * 20)
+    grids = vox.voxelize_batch(molecules)
+    for grid, molecule in zip(grids, molecules):
+        assert torch.allclose(grid, vox.voxelize(molecule), atol=1e-5)
+
+    # without a budget, the batch is tiled to the footprint of its largest complex
+    vox = VoxelGrid([VolumeView(), BasicView()], 1.0, [24.0, 24.0, 24.0])
+    grids = vox.voxelize_batch(molecules)
+    for grid, molecule in zip(grids, molecules):
+        assert torch.allclose(grid, vox.voxelize(molecule), atol=1e-5)
+    assert vox.voxelize_batch([]).shape == (0, *vox.shape)
+
+    vox = VoxelGrid([VolumeView()], 1.0, [24.0, 24.0, 24.0], engine="stamp")
+    grids = vox.voxelize_batch(molecules)
+    assert torch.allclose(grids[1], vox.voxelize(ligand_only))
+
+
+def test_pack_channels():
+    mask = torch.rand(130, 20) > 0.5
+    bits = pack_channels(mask)
+    assert bits.shape == (3, 20) and bits.dtype == torch.int64
+    assert torch.equal(unpack_channels(bits, 130), mask)
+    assert pack_channels(torch.zeros((0, 5), dtype=torch.bool)).shape == (1, 5)
+
+
+@pytest.mark.parametrize("engine", VoxelGrid.ENGINES)
+def test_voxelize_with_packed_channels(engine):
+    # 70 element channels, so BasicView channels cross a word boundary
+    elements = ["C", "H", "O", "N", "S", "P", "Ca"] * 10
+    many = TableView(
+        complex={f"{e}{i}": {"element": e} for i, e in enumerate(elements)}
+    )
+    vox = VoxelGrid([many, BasicView()], 1.0, [12.0, 12.0, 12.0], engine=engine)
+    mask = vox.get_channels_mask(MOLECULE)
+    bits = vox.get_channels_bits(MOLECULE)
+
+    assert bits.shape == (2, MOLECULE.n_atoms)
+    assert torch.equal(unpack_channels(bits, vox.num_channels), mask)
+    assert torch.equal(
+        get_channel_segments(bits, vox.num_channels)[2], get_channel_segments(mask)[2]
+    )
+
+    grid = vox.voxelize(MOLECULE)
+    assert torch.equal(vox.voxelize(MOLECULE, channels=mask), grid)
+    assert torch.equal(vox.voxelize(MOLECULE, channels=bits), grid)
+    assert torch.any(grid[0])
+    assert torch.allclose(grid[0], grid[70])  # carbon channels of both views
+    assert torch.allclose(grid[7], grid[70])
+    with pytest.raises(ValueError):
+        vox.voxelize(MOLECULE, channels=bits[:1])
+
+
+def test_get_atom_tiles():
+    offsets = [0, 3, 5, 12, 13]
+    assert _get_atom_tiles(offsets, 13) == [0, 13]
+    assert _get_atom_tiles(offsets, 5) == [0, 5, 10, 13]  # group 2 is split
+    assert _get_atom_tiles(offsets, 7) == [0, 5, 12, 13]
+    assert _get_atom_tiles([0], 4) == [0]
+
+
+def test_get_channel_segments():
+    channels = torch.tensor(
+        [
+            [1, 1, 0, 1, 0],
+            [0, 1, 0, 0, 0],
+            [1, 1, 0, 1, 1],
+        ],
+        dtype=torch.bool,
+    )
+    order, offsets, groups = get_channel_segments(channels)
+
+    assert 2 not in order  # atom in no channel
+    assert offsets[-1] == len(order) == 4
+    for g in range(groups.shape[0]):
+        atoms = order[offsets[g] : offsets[g + 1]]
+        assert torch.all(channels[:, atoms] == groups[g][:, None])
+
+    # every channel is the union of its groups
+    for c in range(channels.shape[0]):
+        atoms = [
+            a
+            for g in torch.nonzero(groups[:, c])
+            for a in order[offsets[g] : offsets[g + 1]]
+        ]
+        assert sorted(atoms) == torch.nonzero(channels[c]).squeeze(1).tolist()
+
+    order, offsets, groups = get_channel_segments(torch.zeros((3, 0), dtype=torch.bool))
+    assert len(order) == 0 and groups.shape == (0, 3)
+
+
+def test_voxel_grid_output_dtypes():
+    reference = VOXEL.voxelize(MOLECULE).cpu()
+    for dtype, atol in (
+        (torch.float16, 1e-3),
+        (torch.bfloat16, 4e-3),
+        (torch.uint8, 0.5 / 255 + 1e-6),
+    ):
+        for engine in ("dense", "stamp"):
+            vox = VoxelGrid(
+                [VolumeView(), BasicView()],
+                1.0,
+                [24.0, 24.0, 24.0],
+                engine=engine,
+                dtype=dtype,
+            )
+            grid = vox.voxelize(MOLECULE)
+            assert grid.dtype == dtype
+            assert torch.allclose(dequantize(grid).cpu(), reference, atol=atol)
+
+    assert dequantize(torch.tensor([0, 255], dtype=torch.uint8)).tolist() == [0.0, 1.0]
+
+
+def test_voxelize_sparse():
+    grid = VOXEL.voxelize(MOLECULE)
+
+    sparse = VOXEL.voxelize_sparse(MOLECULE)
+    assert sparse.is_sparse and sparse.is_coalesced()
+    assert sparse.shape == grid.shape
+    assert torch.equal(densify(sparse), grid)
+    assert torch.equal(sparse.to_dense(), grid)
+
+    sparse = VOXEL.voxelize_sparse(MOLECULE, threshold=1e-2)
+    assert torch.all(sparse.values() > 1e-2)
+    assert torch.allclose(densify(sparse, out=torch.ones_like(grid)), grid, atol=1e-2)
+
+    quantized = to_sparse(torch.tensor([0, 1, 3, 255], dtype=torch.uint8), 2 / 255)
+    assert quantized.values().tolist() == [3, 255]
+
+
+@pytest.mark.parametrize("engine", VoxelGrid.ENGINES)
+def test_voxelize_poses(engine):
+    vox = VoxelGrid([VolumeView(), BasicView()], 1.0, [24.0, 24.0, 24.0], engine=engine)
+    ligand = MOLECULE.coords[:, MOLECULE.n_atoms_protein :]
+    shift = torch.tensor([1.5, -2.0, 0.5])[:, None]
+    poses = torch.stack((ligand, ligand + shift, ligand - 20))
+
+    grids = vox.voxelize_poses(MOLECULE, poses)
+    assert grids.shape == (3, *vox.shape)
+    for grid, pose in zip(grids, poses):
+        molecule = copy.deepcopy(MOLECULE)
+        molecule.coords[:, molecule.n_atoms_protein :] = pose
+        assert torch.allclose(grid, vox.voxelize(molecule), atol=1e-5)
+
+    receptor = vox.voxelize_receptor(MOLECULE)
+    assert torch.equal(vox.voxelize_poses(MOLECULE, poses, receptor=receptor), grids)
+    assert torch.all(receptor[-1] == 0)  # ligand channels
+
+    assert vox.voxelize_poses(MOLECULE, poses[:0]).shape == (0, *vox.shape)
+
+    with pytest.raises(ValueError):
+        vox.voxelize_poses(MOLECULE, poses[:, :, 1:])
+
+
+@pytest.mark.parametrize("engine", VoxelGrid.ENGINES)
+def test_voxelize_rotations(engine):
+    vox = VoxelGrid([VolumeView(), BasicView()], 1.0, [16.0, 16.0, 16.0], engine=engine)
+    rotations = torch.stack((torch.eye(3), *RandomRotation().get_matrices(2).unbind()))
+
+    grids = vox.voxelize_rotations(MOLECULE, rotations)
+    assert grids.shape == (3, *vox.shape)
+    assert torch.allclose(grids[0], vox.voxelize(MOLECULE), atol=1e-5)
+    for grid, matrix in zip(grids, rotations):
+        molecule = copy.deepcopy(MOLECULE)
+        molecule.coords = matrix @ molecule.coords
+        molecule.ligand_center = matrix @ molecule.ligand_center
+        assert torch.allclose(grid, vox.voxelize(molecule), atol=1e-4)
+
+    assert vox.voxelize_rotations(MOLECULE, rotations[:0]).shape == (0, *vox.shape)
+
+
+def test_packed_poses_budget():
+    vox = VoxelGrid([VolumeView(), BasicView()], 1.0, [16.0, 16.0, 16.0])
+    rotations = RandomRotation().get_matrices(4)
+    n_points = math.prod(vox.shape[1:])
+    coords = torch.zeros(3, 10)
+    atoms = [(coords, None, None), (coords[:, :4], None, None)]
+
+    # a packed pass is tiled to the largest set of atoms, or to a cache-sized tile
+    assert vox._get_packed_budget(n_points, atoms) == 10 * n_points * vox.BYTES_PER_PAIR
+    atoms = [(torch.zeros(3, 10**4), None, None)]
+    pairs = vox.PACKED_TILE_PAIRS
+    assert vox._get_packed_budget(n_points, atoms) == pairs * vox.BYTES_PER_PAIR
+    assert vox._get_packed_budget(10**6, atoms) == 10**6 * vox.BYTES_PER_PAIR
+    vox.memory_budget = 2**20
+    assert vox._get_packed_budget(n_points, atoms) == 2**20
+
+    vox.memory_budget = None
+    grids = vox.voxelize_rotations(MOLECULE, rotations)
+    for grid, matrix in zip(grids, rotations):
+        assert torch.allclose(grid, vox.voxelize_rotations(MOLECULE, matrix[None])[0])
+
+
+def test_voxelize_with_buffer_pool():
+    vox = VoxelGrid([VolumeView(), BasicView()], 1.0, [16.0, 16.0, 16.0], num_buffers=2)
+    expected = vox.voxelize(MOLECULE).clone()
+    first, second, third = (vox.voxelize(MOLECULE).data_ptr() for _ in range(3))
+    assert first != second and first == third  # buffers are reused in turn
+    assert torch.equal(vox.voxelize(MOLECULE), expected)
+
+    # requires_grad grids are never taken from the pool
+    assert vox.voxelize(MOLECULE, requires_grad=True).data_ptr() not in (first, second)
+
+    clone = pickle.loads(pickle.dumps(vox))
+    assert clone._buffers == []
+    assert torch.equal(clone.voxelize(MOLECULE), expected)
+
+
+def test_get_pocket_params():
+    vox = VoxelGrid([VolumeView()], 1.0, [24.0, 24.0, 24.0], cutoff=2.5)
+    assert vox.get_pocket_params() == pytest.approx((math.sqrt(3 * 12.0**2), 2.5))
+
+    vox = VoxelGrid([VolumeView()], 1.0, [24.0, 24.0, 24.0])
+    assert vox.get_pocket_params()[1] == pytest.approx(vdw_cutoff(1e-6))
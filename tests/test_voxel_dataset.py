@@ -1,4 +1,6 @@
+import numpy as np
 import torch
+from torch.utils.data import DataLoader
 
 from docktgrid.transforms import RandomRotation
 from docktgrid.view import BasicView
@@ -59,3 +61,38 @@ def test_voxel_dataset_without_rotation():
     assert torch.any(grid1)
     assert torch.any(grid2)
     assert torch.allclose(grid1, grid2)
+
+
+def test_voxel_dataset_with_pocket_cropping():
+    dataset = setup_data(["1xap", "4bb9"])
+    cropped = setup_data(["1xap", "4bb9"])
+    cropped.crop_pocket = True
+
+    for (grid, _), (expected, _) in zip(cropped, dataset):
+        assert torch.allclose(grid, expected, atol=1e-6)
+
+
+def test_voxel_dataset_with_channels_cache():
+    dataset = setup_data(["1xap", "4bb9"])
+    dataset.cache_channels = True
+    dataset.transform = [RandomRotation()]
+    expected = setup_data(["1xap", "4bb9"])
+    expected.transform = [RandomRotation()]
+
+    # cached masks are reused across epochs and give the same grids
+    for seed in (0, 1):
+        np.random.seed(seed)
+        grid, _ = dataset[1]
+        np.random.seed(seed)
+        assert torch.allclose(grid, expected[1][0])
+    assert list(dataset._channels_cache) == [1]
+
+
+def test_voxel_dataset_with_buffer_pool():
+    dataset = setup_data()
+    expected = torch.stack([grid for grid, _ in dataset])
+
+    # the pool of the voxel grid is smaller than a batch
+    dataset.voxel.num_buffers = 2
+    grids, _ = next(iter(DataLoader(dataset, batch_size=4)))
+    assert torch.equal(grids, expected[:4])
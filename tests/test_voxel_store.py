@@ -0,0 +1,111 @@
+import pickle
+
+import numpy as np
+import pytest
+import torch
+from torch.utils.data import DataLoader
+
+from docktgrid.view import VolumeView
+from docktgrid.voxel import VoxelGrid
+from docktgrid.voxel_dataset import VoxelDataset
+from docktgrid.voxel_store import VoxelStoreDataset, VoxelStoreWriter, write_voxel_store
+
+
+def test_write_and_read_store(tmp_path):
+    grids = torch.rand(5, 2, 3, 3, 3)
+    with VoxelStoreWriter(tmp_path, (2, 3, 3, 3), shard_size=2) as writer:
+        for i, grid in enumerate(grids):
+            writer.append(grid, label=i, id=f"c{i}")
+        with pytest.raises(ValueError):
+            writer.append(grids[0, 0], label=0)
+
+    store = VoxelStoreDataset(tmp_path)
+    assert len(store) == 5 and store.shape == (2, 3, 3, 3)
+    assert len(store.header["shards"]) == 3
+    assert store.ids == ["c0", "c1", "c2", "c3", "c4"]
+    for i in range(-1, 5):
+        grid, label = store[i]
+        assert torch.equal(grid, grids[i]) and label == i % 5
+    with pytest.raises(IndexError):
+        store[5]
+
+    # the last shard only holds its samples
+    assert np.load(tmp_path / "shard-00002.npy").shape == (1, 2, 3, 3, 3)
+
+    # samples are views of the map, writing to them does not modify the store
+    grid, _ = store[0]
+    grid.zero_()
+    assert torch.equal(VoxelStoreDataset(tmp_path)[0][0], grids[0])
+
+
+def test_store_from_voxel_dataset(tmp_path):
+    pdbs = ["1xap", "4bb9", "6std"]
+    voxel = VoxelGrid([VolumeView()], 1.0, [8.0, 8.0, 8.0], dtype=torch.float16)
+    dataset = VoxelDataset(
+        [f"{pdb}_protein.pdb" for pdb in pdbs],
+        [f"{pdb}_ligand.pdb" for pdb in pdbs],
+        labels=[1.0, 2.0, 3.0],
+        voxel=voxel,
+        root_dir="tests/data/dataset",
+    )
+    write_voxel_store(tmp_path, dataset, ids=pdbs, shard_size=2)
+
+    store = VoxelStoreDataset(tmp_path)
+    assert (
+        store.header["metadata"]["voxel"]["channels"]
+        == voxel.views[0].get_channels_names()
+    )
+    assert store.header["metadata"]["voxel"]["box_dims"] == [8.0, 8.0, 8.0]
+    for (grid, label), (expected, expected_label) in zip(store, dataset):
+        assert grid.dtype == torch.float16
+        assert torch.equal(grid, expected) and label == expected_label
+
+    # workers open their own maps
+    clone = pickle.loads(pickle.dumps(store))
+    assert torch.equal(clone[2][0], store[2][0])
+    grids, labels = next(iter(DataLoader(store, batch_size=3)))
+    assert grids.shape == (3, *voxel.shape) and labels.tolist() == [1.0, 2.0, 3.0]
+
+
+def test_failed_write_leaves_store_incomplete(tmp_path):
+    with pytest.raises(RuntimeError):
+        with VoxelStoreWriter(tmp_path, (1, 2, 2, 2), shard_size=4) as writer:
+            writer.append(torch.rand(1, 2, 2, 2), label=0)
+            raise RuntimeError("voxelization failed")
+
+    assert not (tmp_path / "header.json").exists()
+    with pytest.raises(FileNotFoundError):
+        VoxelStoreDataset(tmp_path)
+
+
+def test_bfloat16_store(tmp_path):
+    grids = torch.rand(3, 1, 2, 2, 2).to(torch.bfloat16)
+    with VoxelStoreWriter(tmp_path, (1, 2, 2, 2), dtype=torch.bfloat16) as writer:
+        for grid in grids:
+            writer.append(grid, label=0)
+
+    store = VoxelStoreDataset(tmp_path)
+    assert store.header["torch_dtype"] == "bfloat16"
+    for i, grid in enumerate(grids):
+        assert store[i][0].dtype == torch.bfloat16
+        assert torch.equal(store[i][0], grid)
+
+
+def test_append_checks_dtype(tmp_path):
+    grid = torch.tensor([0.5, 1.0]).view(1, 2, 1, 1)
+    with VoxelStoreWriter(tmp_path / "float32", (1, 2, 1, 1)) as writer:
+        with pytest.raises(ValueError):
+            writer.append(grid.to(torch.bfloat16), label=0)
+        with pytest.raises(ValueError):
+            writer.append(grid.double().numpy(), label=0)
+        writer.append(grid.numpy(), label=0)
+
+    with VoxelStoreWriter(tmp_path / "uint8", (1, 2, 1, 1), dtype=torch.uint8) as w:
+        with pytest.raises(ValueError):
+            w.append(grid, label=0)
+
+    with VoxelStoreWriter(tmp_path / "bf16", (1, 2, 1, 1), torch.bfloat16) as w:
+        with pytest.raises(ValueError):
+            w.append(grid.to(torch.bfloat16).view(torch.int16).numpy(), label=0)
+
+    assert torch.equal(VoxelStoreDataset(tmp_path / "float32")[0][0], grid)